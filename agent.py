@@ -1,52 +1,67 @@
+import asyncio
+import functools
+import logging
+from contextlib import aclosing
+
 from dotenv import load_dotenv
 from strictjson import strict_json_async
 
-from prompts import (
-    AGENT_PROMPT,
-    EXTRACT_SYS_PROMPT,
-    EXTRACT_USER_PROMPT,
-    RAG_SYS_PROMPT,
-    RAG_USER_PROMPT,
-)
-from sarvam import speaker, translator
-from scraper import extract
+from config import BATCH_CONCURRENCY, RERANK_CANDIDATES, SPECULATION
+from llm_client import llm_client
+from logs import fields
+from memory import memory
+from metrics import Span, traced
+from prompts import CONVERSATION_PROMPT, EXTRACT_SYS_PROMPT, EXTRACT_USER_PROMPT, RAG_USER_PROMPT
+from registry import registry
+from rerank import build_context
+from router import router
+from sarvam import code_map, speaker, translator
+from semantic_cache import answer_cache
+from speculation import Speculation
 
 load_dotenv()
+log = logging.getLogger(__name__)
 
 
-async def llm(system_prompt: str, user_prompt: str) -> str:
-    import os
-
-    from groq import AsyncGroq
+LLM_PARAMS = {"temperature": 0.3, "max_tokens": 360, "top_p": 1, "stop": None}
+NO_SPEECH_SOURCE = "Which text should I read out? Put it in quotes, e.g. read \"energy is the capacity to do work\" aloud."
 
-    client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
-    messages = [
+def chat_messages(system_prompt: str, user_prompt: str) -> list:
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    chat_completion = await client.chat.completions.create(
-        messages=messages,
-        model="llama3-70b-8192",
-        temperature=0.3,
-        max_tokens=360,
-        top_p=1,
-        stop=None,
-        stream=False,
-    )
 
-    return chat_completion.choices[0].message.content
+async def llm(system_prompt: str, user_prompt: str) -> str:
+    with Span("llm") as span:
+        span.size("in", len(system_prompt.encode()) + len(user_prompt.encode()))
+        response = await llm_client.chat(chat_messages(system_prompt, user_prompt), stream=False, **LLM_PARAMS)
+        span.size("out", len((response or "").encode()))
+        return response
 
 
-async def call_agent(user_prompt, collection):
-    grade, subject, chapter = collection.split("_")
+async def llm_stream(system_prompt: str, user_prompt: str):
+    with Span("llm") as span:
+        span.size("in", len(system_prompt.encode()) + len(user_prompt.encode()))
+        size = 0
+        async for token in llm_client.stream(chat_messages(system_prompt, user_prompt), **LLM_PARAMS):
+            size += len(token.encode())
+            yield token
+        span.size("out", size)
 
-    system_prompt = AGENT_PROMPT.format(grade, subject)
 
+def with_history(prompt: str, session) -> str:
+    history = memory.render(session)
+    return CONVERSATION_PROMPT.format(history) + prompt if history else prompt
+
+
+@traced("call_agent")
+async def call_agent(user_prompt, collection, session=None):
     result = await strict_json_async(
-        system_prompt=system_prompt,
-        user_prompt=user_prompt,
+        system_prompt=registry.get(collection).agent_prompt,
+        user_prompt=with_history(user_prompt, session),
         output_format={
             "function": 'Type of function to call, type: Enum["retriever", "translator", "speaker", "none", "extractor"]',
             "keywords": "Array of keywords, type: List[str]",
@@ -62,45 +77,329 @@ async def call_agent(user_prompt, collection):
     return result
 
 
-async def retriever(user_prompt, collection, client):
-    grade, subject, chapter = collection.split("_")
+async def search_hits(user_prompt, collection, client, vector, session=None):
+    # Follow-ups on the same topic rerank the previous turn's candidates instead of searching again
+    hits = memory.reusable_hits(session, collection, vector)
+    if hits is None:
+        hits = await client.asearch(collection, user_prompt, limit=RERANK_CANDIDATES)
+    return hits
+
+
+async def rag_prompts(user_prompt, collection, hits, session=None):
+    """System and user prompts with the packed retrieval context, and its sources"""
+    context, sources = await asyncio.to_thread(build_context, user_prompt, hits)
+
+    user_prompt = with_history(RAG_USER_PROMPT.format(context, user_prompt), session)
+    return registry.get(collection).rag_prompt, user_prompt, sources
+
+
+def shares_cache(session) -> bool:
+    """Answers that depend on earlier turns are neither served from nor stored in the shared answer cache"""
+    return session is None or not session.has_context
+
+
+async def cached_answer(user_prompt, collection, client, session=None):
+    vector = await client.aembed(user_prompt)
+    return vector, (answer_cache.get(collection, vector) if shares_cache(session) else None)
+
+
+async def draft_answer(user_prompt, collection, client, vector, session=None):
+    """The whole RAG answer, without side effects, so it can run speculatively"""
+    hits = await search_hits(user_prompt, collection, client, vector, session)
+    system_prompt, prompt, sources = await rag_prompts(user_prompt, collection, hits, session)
+    return hits, sources, await llm(system_prompt, prompt)
+
+
+async def draft_answer_stream(user_prompt, collection, client, vector, session, tokens: asyncio.Queue):
+    """Same as draft_answer, putting tokens on a queue (ended with None) as they are generated"""
+    try:
+        hits = await search_hits(user_prompt, collection, client, vector, session)
+        system_prompt, prompt, sources = await rag_prompts(user_prompt, collection, hits, session)
+        async for token in llm_stream(system_prompt, prompt):
+            tokens.put_nowait(token)
+        return hits, sources
+    finally:
+        tokens.put_nowait(None)
+
+
+def speculate(user_prompt, collection, client, vector, session=None, stream=False, level=SPECULATION) -> Speculation | None:
+    """Starts retrieval (level "search") or the whole answer (level "answer") before
+    the LLM router has decided on it"""
+    if level == "search":
+        return Speculation(level, search_hits(user_prompt, collection, client, vector, session))
+    if level == "answer" and stream:
+        tokens = asyncio.Queue()
+        return Speculation(level, draft_answer_stream(user_prompt, collection, client, vector, session, tokens), tokens)
+    if level == "answer":
+        return Speculation(level, draft_answer(user_prompt, collection, client, vector, session))
+    return None
+
+
+@traced("retriever")
+async def retriever(user_prompt, collection, client, vector=None, session=None, speculation=None):
+    # A vector is only passed in by callers that already missed the cache with it
+    if vector is None:
+        vector, cached = await cached_answer(user_prompt, collection, client, session)
+        if cached is not None:
+            return cached
+
+    if speculation is not None:
+        speculation.keep()
+    if speculation is not None and speculation.level == "answer":
+        hits, sources, text = await speculation.task
+    else:
+        hits = await speculation.task if speculation else await search_hits(user_prompt, collection, client, vector, session)
+        system_prompt, prompt, sources = await rag_prompts(user_prompt, collection, hits, session)
+        text = await llm(system_prompt, prompt)
+    memory.remember_hits(session, collection, vector, hits)
+
+    response = {"text": text, "sources": sources}
+    if shares_cache(session):
+        answer_cache.put(collection, vector, response)
+    return response
+
+
+@traced("retriever")
+async def retriever_stream(user_prompt, collection, client, vector=None, session=None, speculation=None):
+    if vector is None:
+        vector, cached = await cached_answer(user_prompt, collection, client, session)
+        if cached is not None:
+            yield cached["text"]
+            yield {"sources": cached["sources"]}
+            return
+
+    if speculation is not None:
+        speculation.keep()
+    tokens = []
+    if speculation is not None and speculation.level == "answer":
+        # Tokens generated while the router was deciding come out at once, the rest as they arrive
+        try:
+            async for token in speculation.stream():
+                tokens.append(token)
+                yield token
+            hits, sources = await speculation.task
+        finally:
+            # Stops generating if the client goes away mid-stream
+            speculation.task.cancel()
+    else:
+        hits = await speculation.task if speculation else await search_hits(user_prompt, collection, client, vector, session)
+        system_prompt, prompt, sources = await rag_prompts(user_prompt, collection, hits, session)
+        async for token in llm_stream(system_prompt, prompt):
+            tokens.append(token)
+            yield token
+    memory.remember_hits(session, collection, vector, hits)
+    # Sources follow the answer text as a separate event
+    yield {"sources": sources}
+    if shares_cache(session):
+        answer_cache.put(collection, vector, {"text": "".join(tokens), "sources": sources})
+
+
+async def completed(jobs: list, concurrency: int):
+    """Runs coroutine functions at most `concurrency` at a time, yielding (position,
+    result) as each completes, or (position, exception) for one that failed. Jobs
+    still pending are cancelled if the caller stops early."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(position, job):
+        async with semaphore:
+            try:
+                return position, await job()
+            except Exception as e:
+                return position, e
+
+    tasks = [asyncio.create_task(run(position, job)) for position, job in enumerate(jobs)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def positions(queries: list) -> dict:
+    """Query -> its indexes in the batch, so repeated queries are answered once"""
+    indexes = {}
+    for i, query in enumerate(queries):
+        indexes.setdefault(query, []).append(i)
+    return indexes
 
-    data = client.search(collection, user_prompt)
-    data = [i.document for i in data]
 
-    system_prompt = RAG_SYS_PROMPT.format(subject, grade)
-    user_prompt = RAG_USER_PROMPT.format(data, user_prompt)
+@traced("retriever_batch")
+async def retriever_batch(queries: list[tuple[str, str]], client, concurrency: int = BATCH_CONCURRENCY):
+    """retriever for many (user prompt, collection) pairs, yielding (index, response)
+    as each completes. Cache misses are embedded and searched together, one backend
+    call per collection, then answered `concurrency` at a time."""
+    indexes = positions(queries)
+    unique = list(indexes)
+    vectors = await asyncio.gather(*(client.aembed(user_prompt) for user_prompt, _ in unique))
+    cached = [answer_cache.get(collection, vector) for (_, collection), vector in zip(unique, vectors)]
 
-    return await llm(system_prompt, user_prompt)
+    slots, misses = {}, {}
+    for position, ((user_prompt, collection), response) in enumerate(zip(unique, cached)):
+        if response is None:
+            slots[position] = len(misses.setdefault(collection, []))
+            misses[collection].append(user_prompt)
+    searches = {
+        collection: asyncio.create_task(client.asearch_batch(collection, prompts, limit=RERANK_CANDIDATES)) for collection, prompts in misses.items()
+    }
 
+    async def answer(position):
+        user_prompt, collection = unique[position]
+        if cached[position] is not None:
+            return cached[position]
+        hits = (await searches[collection])[slots[position]]
+        system_prompt, prompt, sources = await rag_prompts(user_prompt, collection, hits)
+        response = {"text": await llm(system_prompt, prompt), "sources": sources}
+        answer_cache.put(collection, vectors[position], response)
+        return response
 
-async def extractor(user_prompt, url):
-    text = await extract(url)
+    try:
+        async with aclosing(completed([functools.partial(answer, position) for position in range(len(unique))], concurrency)) as results:
+            async for position, response in results:
+                for i in indexes[unique[position]]:
+                    yield i, response
+    finally:
+        for task in searches.values():
+            task.cancel()
+
+
+async def extractor(user_prompt, url, client, session=None):
+    return await llm(*(await extract_prompts(user_prompt, url, client, session)))
+
+
+async def extractor_stream(user_prompt, url, client, session=None):
+    async for token in llm_stream(*(await extract_prompts(user_prompt, url, client, session))):
+        yield token
+
+
+async def extract_prompts(user_prompt, url, client, session=None):
+    from scraper import ExtractError, extract
+
+    try:
+        text = await extract(url, user_prompt, client)
+    except ExtractError as e:
+        # The model still answers, from its own knowledge
+        log.warning("extraction failed: %s", e, extra=fields(url=url))
+        text = "(The page could not be read.)"
 
     system_prompt = EXTRACT_SYS_PROMPT.format(url)
-    user_prompt = EXTRACT_USER_PROMPT.format(text, user_prompt)
+    user_prompt = with_history(EXTRACT_USER_PROMPT.format(text, user_prompt), session)
+    return system_prompt, user_prompt
+
 
-    return await llm(system_prompt, user_prompt)
+async def route(user_prompt, collection, client, session=None, stream=False):
+    """Returns (decision, query vector, cached answer, speculation). The vector is
+    set only when the semantic cache was already checked with it. The speculation,
+    if any, must be kept by the retriever or discarded."""
+    # Obvious queries are routed locally; only ambiguous ones pay for the LLM router
+    result = await router.route(user_prompt, client)
+    vector, via, speculation = None, "router", None
 
+    if result is None:
+        # Near-duplicates of already answered questions skip the LLM router as well
+        vector, cached = await cached_answer(user_prompt, collection, client, session)
+        if cached is not None:
+            log.info("agent decision", extra=fields(collection=collection, via="cache"))
+            return None, vector, cached, None
+        # Most queries end up in the retriever, so its work starts while the LLM router decides
+        speculation = speculate(user_prompt, collection, client, vector, session, stream)
+        try:
+            result, via = await call_agent(user_prompt, collection, session), "llm"
+        except BaseException:
+            if speculation is not None:
+                speculation.discard()
+            raise
+
+    if speculation is not None and result["function"].lower() != "retriever":
+        speculation.discard()
+        speculation = None
+    log.info("agent decision", extra=fields(collection=collection, via=via, **result))
+    return result, vector, None, speculation
+
+
+async def function_caller(user_prompt, collection, client, session_id=None):
+    """Answers a query; with a session id, earlier turns are used as context and this one is remembered"""
+    session = memory.get(session_id)
+    return memory.record(session, user_prompt, await call_function(user_prompt, collection, client, session))
+
+
+async def call_function(user_prompt, collection, client, session=None):
+    result, vector, cached, speculation = await route(user_prompt, collection, client, session)
+    if cached is not None:
+        return cached
 
-async def function_caller(user_prompt, collection, client):
-    result = await call_agent(user_prompt, collection)
-    print(f"Agent log -\n {result} \n\n")
     function = result["function"].lower()
 
     if function == "none":
         return {"text": result["response"]}
 
     elif function == "retriever":
-        response = await retriever(user_prompt, collection, client)
-        return {"text": response}
+        return await retriever(user_prompt, collection, client, vector, session, speculation)
 
     elif function == "translator":
         return await translator(result["source"], result["src_lang"], result["dest_lang"])
 
     elif function == "speaker":
-        return await speaker(result["source"])
+        return await speak(result)
 
     elif function == "extractor":
-        response = await extractor(user_prompt, result["url"])
+        response = await extractor(user_prompt, result["url"], client, session)
         return {"text": response}
+
+
+async def speak(result):
+    """speaker for a routing result, in the requested language, else the query's"""
+    source = result.get("source")
+    if not isinstance(source, str) or not source.strip() or source.strip().lower() == "none":
+        return {"text": NO_SPEECH_SOURCE}
+    for language in (result.get("dest_lang"), result.get("src_lang"), "hindi"):
+        if isinstance(language, str) and language.lower() in code_map:
+            return await speaker(source, language.lower())
+
+
+async def function_caller_batch(queries: list[tuple[str, str]], client, concurrency: int = BATCH_CONCURRENCY):
+    """function_caller for many (user prompt, collection) pairs, without sessions,
+    yielding (index, response) as each completes"""
+    indexes = positions(queries)
+    unique = list(indexes)
+    jobs = [functools.partial(call_function, user_prompt, collection, client) for user_prompt, collection in unique]
+    async with aclosing(completed(jobs, concurrency)) as results:
+        async for position, response in results:
+            for i in indexes[unique[position]]:
+                yield i, response
+
+
+async def function_caller_stream(user_prompt, collection, client, session_id=None):
+    """Same as function_caller, but yields text tokens (str) as they are generated.
+    Responses that are not generated text are yielded once, as the response dict."""
+    session = memory.get(session_id)
+    async for event in memory.record_stream(session, user_prompt, call_function_stream(user_prompt, collection, client, session)):
+        yield event
+
+
+async def call_function_stream(user_prompt, collection, client, session=None):
+    result, vector, cached, speculation = await route(user_prompt, collection, client, session, stream=True)
+    if cached is not None:
+        yield cached["text"]
+        yield {"sources": cached["sources"]}
+        return
+
+    function = result["function"].lower()
+
+    if function == "retriever":
+        async for token in retriever_stream(user_prompt, collection, client, vector, session, speculation):
+            yield token
+
+    elif function == "extractor":
+        async for token in extractor_stream(user_prompt, result["url"], client, session):
+            yield token
+
+    elif function == "none":
+        yield result["response"]
+
+    elif function == "translator":
+        yield await translator(result["source"], result["src_lang"], result["dest_lang"])
+
+    elif function == "speaker":
+        response = await speak(result)
+        yield response.get("text", response)
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from agent import function_caller, function_caller_batch, function_caller_stream, retriever, retriever_batch, retriever_stream
+from audio_store import audio_store
+from config import BATCH_MAX_QUERIES
+from llm_client import llm_client
+from logs import RequestIdMiddleware, fields, setup_logging, stop_logging
+from memory import memory
+from metrics import TimingMiddleware
+from metrics import render as render_metrics
+from page_cache import page_cache
+from registry import registry
+from sarvam import SarvamError, sarvam_client, speaker, translator
+from semantic_cache import answer_cache
+from shared import collection_name, hclient, load_registry, warmup
+from speech_cache import speech_cache
+
+log = logging.getLogger(__name__)
+
+
+async def preload():
+    try:
+        await asyncio.to_thread(warmup)
+    except Exception:
+        # Stays unready; requests still try to load whatever is missing on first use
+        log.exception("warmup failed")
+        return
+    app.state.ready = True
+    log.info("models loaded, ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    app.state.ready = False
+    # Models load in the background so the server accepts connections (and /ready) right away
+    loading = asyncio.create_task(preload())
+    await llm_client.start()
+    await sarvam_client.start()
+    await asyncio.to_thread(load_registry)
+    cleanup = asyncio.create_task(audio_store.run_cleanup())
+    watch = asyncio.create_task(registry.watch())
+    yield
+    loading.cancel()
+    watch.cancel()
+    cleanup.cancel()
+    await sarvam_client.close()
+    await llm_client.close()
+    await hclient.close()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(SarvamError)
+async def sarvam_error(request: Request, exc: SarvamError):
+    log.warning("sarvam request failed: %s", exc)
+    return JSONResponse(status_code=502, content={"error": str(exc), "upstream_status": exc.status})
+
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
+)
+app.add_middleware(TimingMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
+
+class ChatQuery(BaseModel):
+    query: str
+    grade: str
+    subject: str
+    chapter: str
+    # Optional: queries with the same session id share conversation memory
+    session_id: str | None = None
+
+
+class BatchItem(BaseModel):
+    query: str
+    grade: str
+    subject: str
+    chapter: str
+
+
+class BatchQuery(BaseModel):
+    # Plain strings are asked of the batch's chapter; items name their own
+    queries: list[str | BatchItem] = Field(min_length=1, max_length=BATCH_MAX_QUERIES)
+    grade: str | None = None
+    subject: str | None = None
+    chapter: str | None = None
+
+
+class TranslateQuery(BaseModel):
+    text: str
+    src: str
+    dest: str
+
+
+class TTSQuery(BaseModel):
+    text: str
+    src: str
+
+
+# API Endpoints
+@app.get("/status")
+async def status():
+    return {
+        "status": "200 OK",
+        "endpoints": {
+            "/status": {"method": "GET", "parameters": {}},
+            "/ready": {"method": "GET", "parameters": {}},
+            "/metrics": {"method": "GET", "parameters": {}},
+            "/agent": {"method": "GET", "parameters": {"query": "string", "grade": "string", "subject": "string", "chapter": "string", "session_id": "string (optional)"}},
+            "/agent/stream": {"method": "GET", "parameters": {"query": "string", "grade": "string", "subject": "string", "chapter": "string", "session_id": "string (optional)"}},
+            "/rag": {"method": "GET", "parameters": {"query": "string", "grade": "string", "subject": "string", "chapter": "string", "session_id": "string (optional)"}},
+            "/rag/stream": {"method": "GET", "parameters": {"query": "string", "grade": "string", "subject": "string", "chapter": "string", "session_id": "string (optional)"}},
+            "/agent/batch": {"method": "GET", "parameters": {"queries": "list[string | {query, grade, subject, chapter}]", "grade": "string (optional)", "subject": "string (optional)", "chapter": "string (optional)"}},
+            "/rag/batch": {"method": "GET", "parameters": {"queries": "list[string | {query, grade, subject, chapter}]", "grade": "string (optional)", "subject": "string (optional)", "chapter": "string (optional)"}},
+            "/translate": {"method": "GET", "parameters": {"text": "string", "src": "string", "dest": "string"}},
+            "/tts": {"method": "GET", "parameters": {"text": "string", "src": "string"}},
+            "/audio/{name}": {"method": "GET", "parameters": {}},
+            "/collections": {"method": "GET", "parameters": {}},
+        },
+        "llm": llm_client.stats(),
+        "cache": answer_cache.stats(),
+        "sarvam": sarvam_client.stats(),
+        "speech_cache": speech_cache.stats(),
+        "page_cache": page_cache.stats(),
+        "memory": memory.stats(),
+        "audio": audio_store.stats(),
+        "registry": registry.stats(),
+        # Not created until the models are loaded
+        "embedder": hclient.embedder.stats() if "embedder" in hclient.__dict__ else None,
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the models are loaded and warmed up"""
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency, payload size and LLM token histograms, in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/collections")
+async def collections():
+    return {chapter.collection: chapter.to_json() for chapter in registry.indexed()}
+
+
+def get_collection(grade, subject, chapter):
+    try:
+        return collection_name(grade, subject, chapter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def audio_url(result):
+    """JSON clients get speaker output as a URL to stream from /audio"""
+    if isinstance(result, dict) and "audio" in result:
+        return {"audio_url": f"/audio/{result['audio']}"}
+    return result
+
+
+def audio_response(name, range_header=None, chunk_size=64 * 1024):
+    """Serves a stored clip, honouring a single "bytes=start-end" range"""
+    path = audio_store.path(name, touch=True)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    size = os.path.getsize(path)
+    start, end = 0, size - 1
+    if range_header:
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+        if not match or not any(match.groups()):
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+        if start > end:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    def body():
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start + 1), "Cache-Control": "public, max-age=86400, immutable"}
+    if range_header:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(body(), status_code=206 if range_header else 200, media_type="audio/wav", headers=headers)
+
+
+async def sse(events):
+    """Server-sent events: a "token" event per generated chunk, a "result" event
+    for non-text responses (translation, audio), then "done"."""
+    async for event in events:
+        if isinstance(event, str):
+            yield f"event: token\ndata: {json.dumps({'text': event})}\n\n"
+        else:
+            yield f"event: result\ndata: {json.dumps(audio_url(event))}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+
+def batch_queries(batch: BatchQuery) -> list[tuple[str, str]]:
+    """(query, collection) pairs of a batch"""
+    queries = []
+    for item in batch.queries:
+        if isinstance(item, BatchItem):
+            queries.append((item.query, get_collection(item.grade, item.subject, item.chapter)))
+        elif batch.grade and batch.subject and batch.chapter:
+            queries.append((item, get_collection(batch.grade, batch.subject, batch.chapter)))
+        else:
+            raise HTTPException(status_code=422, detail="Plain string queries need the batch's grade, subject and chapter")
+    return queries
+
+
+async def ndjson(queries, results):
+    """One JSON line per query as it completes: its index and query with the
+    response, or with an error"""
+    async for i, result in results:
+        line = {"index": i, "query": queries[i][0]}
+        if isinstance(result, Exception):
+            log.warning("batch query failed: %r", result, extra=fields(index=i))
+            line["error"] = str(result) or type(result).__name__
+        else:
+            line.update(audio_url(result) or {})
+        yield json.dumps(line) + "\n"
+
+
+@app.get("/agent")
+async def agent(query: ChatQuery):
+    collection = get_collection(query.grade, query.subject, query.chapter)
+    return audio_url(await function_caller(query.query, collection, hclient, query.session_id))
+
+
+@app.get("/agent/stream")
+async def agent_stream(query: ChatQuery):
+    collection = get_collection(query.grade, query.subject, query.chapter)
+    events = function_caller_stream(query.query, collection, hclient, query.session_id)
+    return StreamingResponse(sse(events), media_type="text/event-stream")
+
+
+@app.get("/rag")
+async def rag(query: ChatQuery):
+    collection = get_collection(query.grade, query.subject, query.chapter)
+    session = memory.get(query.session_id)
+    return memory.record(session, query.query, await retriever(query.query, collection, hclient, session=session))
+
+
+@app.get("/rag/stream")
+async def rag_stream(query: ChatQuery):
+    collection = get_collection(query.grade, query.subject, query.chapter)
+    session = memory.get(query.session_id)
+    events = memory.record_stream(session, query.query, retriever_stream(query.query, collection, hclient, session=session))
+    return StreamingResponse(sse(events), media_type="text/event-stream")
+
+
+@app.get("/agent/batch")
+async def agent_batch(batch: BatchQuery):
+    queries = batch_queries(batch)
+    return StreamingResponse(ndjson(queries, function_caller_batch(queries, hclient)), media_type="application/x-ndjson")
+
+
+@app.get("/rag/batch")
+async def rag_batch(batch: BatchQuery):
+    queries = batch_queries(batch)
+    return StreamingResponse(ndjson(queries, retriever_batch(queries, hclient)), media_type="application/x-ndjson")
+
+
+@app.get("/translate")
+async def translate(query: TranslateQuery):
+    return await translator(query.text, query.src, query.dest)
+
+
+@app.get("/tts")
+async def tts(query: TTSQuery, request: Request):
+    if not query.text.strip():
+        raise HTTPException(status_code=400, detail="text must not be empty")
+    result = await speaker(query.text, query.src)
+    return audio_response(result["audio"], request.headers.get("range"))
+
+
+@app.get("/audio/{name}")
+async def audio(name: str, request: Request):
+    return audio_response(name, request.headers.get("range"))
@@ -0,0 +1,143 @@
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import time
+import uuid
+import wave
+
+from config import AUDIO_CLEANUP_INTERVAL, AUDIO_DIR, AUDIO_MAX_AGE, AUDIO_MAX_BYTES
+
+NAME_PATTERN = re.compile(r"^[0-9a-f]{32}\.wav$")
+
+# Base64 is decoded in slices of this many characters (a multiple of 4)
+DECODE_CHUNK = 64 * 1024
+
+
+class AudioStore:
+    """WAV clips on disk, named by a hash of their content so concurrent writers
+    never collide and identical clips are stored once. Files older than `max_age`
+    are removed, and the least recently used ones once the directory exceeds
+    `max_bytes`; serving a file refreshes its modification time."""
+
+    def __init__(self, root: str = AUDIO_DIR, max_bytes: int = AUDIO_MAX_BYTES, max_age: float = AUDIO_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.counters = {"writes": 0, "reads": 0, "evictions": 0, "expired": 0}
+
+    def path(self, name: str, touch: bool = False) -> str | None:
+        """Path of a stored clip, or None for unknown or malformed names. `touch`
+        marks the clip as used, for when it is about to be served."""
+        if not NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.root, name)
+        if not touch:
+            return path if os.path.isfile(path) else None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self.counters["reads"] += 1
+        return path
+
+    def save_clips(self, audios: list[str]) -> str:
+        """Decodes base64 WAV clips with identical formats straight into one file
+        and returns its name. Clips are decoded one at a time, in slices."""
+        if not audios:
+            raise ValueError("no audio clips to save")
+        name = hashlib.sha256("".join(audios).encode()).hexdigest()[:32] + ".wav"
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            os.utime(path)
+            return name
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if len(audios) == 1:
+                with open(tmp, "wb") as f:
+                    decode_to(audios[0], f)
+            else:
+                with wave.open(tmp, "wb") as merged:
+                    for i, audio in enumerate(audios):
+                        with wave.open(DecodedReader(audio), "rb") as clip:
+                            if i == 0:
+                                merged.setparams(clip.getparams())
+                            while frames := clip.readframes(DECODE_CHUNK):
+                                merged.writeframes(frames)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self.counters["writes"] += 1
+        return name
+
+    def cleanup(self):
+        """Applies the age and size limits"""
+        if not os.path.isdir(self.root):
+            return
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age or (entry.name.endswith(".tmp") and now - stat.st_mtime > 3600):
+                remove(entry.path)
+                self.counters["expired"] += 1
+            elif NAME_PATTERN.match(entry.name):
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            remove(path)
+            self.counters["evictions"] += 1
+            total -= size
+
+    async def run_cleanup(self, interval: float = AUDIO_CLEANUP_INTERVAL):
+        """Background task started with the app"""
+        while True:
+            await asyncio.to_thread(self.cleanup)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        files = [entry.stat().st_size for entry in os.scandir(self.root) if NAME_PATTERN.match(entry.name)] if os.path.isdir(self.root) else []
+        return self.counters | {"files": len(files), "bytes": sum(files)}
+
+
+class DecodedReader:
+    """Minimal file-like reader over a base64 string that decodes on demand"""
+
+    def __init__(self, data: str):
+        self.data = data
+        self.offset = 0
+        self.buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.buffer) < size) and self.offset < len(self.data):
+            self.buffer += base64.b64decode(self.data[self.offset : self.offset + DECODE_CHUNK])
+            self.offset += DECODE_CHUNK
+        if size < 0:
+            size = len(self.buffer)
+        out, self.buffer = self.buffer[:size], self.buffer[size:]
+        return out
+
+
+def decode_to(data: str, f):
+    for offset in range(0, len(data), DECODE_CHUNK):
+        f.write(base64.b64decode(data[offset : offset + DECODE_CHUNK]))
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+audio_store = AudioStore()
@@ -0,0 +1,514 @@
+import asyncio
+import json
+import os
+import shutil
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class Hit:
+    id: str | int
+    document: str
+    metadata: dict
+    score: float | None = None
+
+
+@dataclass
+class SparseVector:
+    indices: np.ndarray
+    values: np.ndarray
+
+
+# Integer payload fields indexed for filtered search
+PAYLOAD_INDEXES = ("grade", "chapter", "page")
+
+# Filters are {field: condition}, all of which must hold. A condition is a value,
+# a list of values (any of them) or an inclusive (low, high) range:
+#     {"chapter": 3}, {"chapter": [1, 4]}, {"chapter": (3, 7)}
+
+
+def reciprocal_rank_fusion(responses: list[list[Hit]], limit: int = 10) -> list[Hit]:
+    """Same fusion as qdrant_client.query: 1 / (2 + rank) summed over result lists"""
+    scores = {}
+    points = {}
+    for response in responses:
+        for rank, hit in enumerate(response):
+            scores[hit.id] = scores.get(hit.id, 0.0) + 1 / (2 + rank)
+            points.setdefault(hit.id, hit)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [Hit(points[id].id, points[id].document, points[id].metadata, score) for id, score in ranked]
+
+
+class QdrantBackend:
+    """Remote Qdrant collections, laid out the way qdrant_client's fastembed mixin
+    creates them so existing collections keep working"""
+
+    def __init__(self, url: str, api_key: str, dense_name: str, sparse_name: str):
+        from qdrant_client import AsyncQdrantClient, QdrantClient
+
+        self.client = QdrantClient(url=url, api_key=api_key)
+        # Used by the request path; the sync client serves ingestion and scripts
+        self.async_client = AsyncQdrantClient(url=url, api_key=api_key)
+        self.dense_name = dense_name
+        self.sparse_name = sparse_name
+
+    def exists(self, collection: str) -> bool:
+        return self.client.collection_exists(collection)
+
+    def collections(self) -> list[str]:
+        return [collection.name for collection in self.client.get_collections().collections]
+
+    def create(self, collection: str, dim: int):
+        from qdrant_client import models
+
+        self.client.create_collection(
+            collection_name=collection,
+            vectors_config={self.dense_name: models.VectorParams(size=dim, distance=models.Distance.COSINE)},
+            sparse_vectors_config={self.sparse_name: models.SparseVectorParams(index=models.SparseIndexParams())},
+            quantization_config=models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=False,
+                ),
+            ),
+        )
+        for name in PAYLOAD_INDEXES:
+            self.client.create_payload_index(collection_name=collection, field_name=name, field_schema=models.PayloadSchemaType.INTEGER)
+
+    def upsert(self, collection: str, ids: list, dense: list, sparse: list[SparseVector], payloads: list[dict], batch_size: int = 64):
+        from qdrant_client import models
+
+        points = [
+            models.PointStruct(
+                id=id,
+                vector={
+                    self.dense_name: vector.tolist(),
+                    self.sparse_name: models.SparseVector(indices=sparse_vector.indices.tolist(), values=sparse_vector.values.tolist()),
+                },
+                payload=payload,
+            )
+            for id, vector, sparse_vector, payload in zip(ids, dense, sparse, payloads)
+        ]
+        for i in range(0, len(points), batch_size):
+            self.client.upsert(collection_name=collection, points=points[i : i + batch_size])
+
+    def search(self, collection: str, dense, sparse: SparseVector, limit: int = 10, filter: dict = None) -> list[Hit]:
+        responses = self.client.search_batch(collection_name=collection, requests=self.search_requests(dense, sparse, limit, filter))
+        return reciprocal_rank_fusion([[to_hit(point) for point in response] for response in responses], limit=limit)
+
+    async def asearch(self, collection: str, dense, sparse: SparseVector, limit: int = 10, filter: dict = None) -> list[Hit]:
+        responses = await self.async_client.search_batch(collection_name=collection, requests=self.search_requests(dense, sparse, limit, filter))
+        return reciprocal_rank_fusion([[to_hit(point) for point in response] for response in responses], limit=limit)
+
+    async def asearch_batch(self, collection: str, vectors: list, limit: int = 10, filter: dict = None) -> list[list[Hit]]:
+        """Hits for many (dense, sparse) queries in one round trip. Queries over one
+        chapter share most of their hits, so payloads are fetched once per point."""
+        requests = [request for dense, sparse in vectors for request in self.search_requests(dense, sparse, limit, filter, with_payload=False)]
+        responses = await self.async_client.search_batch(collection_name=collection, requests=requests)
+        results = [
+            reciprocal_rank_fusion([[to_hit(point) for point in response] for response in responses[i : i + 2]], limit=limit)
+            for i in range(0, len(responses), 2)
+        ]
+
+        ids = list({hit.id: None for hits in results for hit in hits})
+        points = await self.async_client.retrieve(collection_name=collection, ids=ids, with_payload=True) if ids else []
+        payloads = {point.id: point.payload for point in points}
+        return [
+            [Hit(hit.id, payloads[hit.id].get("document", ""), payloads[hit.id], hit.score) for hit in hits if hit.id in payloads]
+            for hits in results
+        ]
+
+    def search_requests(self, dense, sparse: SparseVector, limit: int, filter: dict = None, with_payload: bool = True) -> list:
+        from qdrant_client import models
+
+        dense_request = models.SearchRequest(
+            vector=models.NamedVector(name=self.dense_name, vector=dense.tolist()),
+            filter=qdrant_filter(filter),
+            limit=limit,
+            with_payload=with_payload,
+        )
+        sparse_request = models.SearchRequest(
+            vector=models.NamedSparseVector(
+                name=self.sparse_name,
+                vector=models.SparseVector(indices=sparse.indices.tolist(), values=sparse.values.tolist()),
+            ),
+            filter=qdrant_filter(filter),
+            limit=limit,
+            with_payload=with_payload,
+        )
+        return [dense_request, sparse_request]
+
+    def retrieve(self, collection: str, ids: list) -> list[Hit]:
+        return [to_hit(point) for point in self.client.retrieve(collection_name=collection, ids=ids)]
+
+    def count(self, collection: str, filter: dict = None) -> int:
+        return self.client.count(collection_name=collection, count_filter=qdrant_filter(filter), exact=True).count
+
+    def facet(self, collection: str, field: str) -> dict:
+        """Number of points per value of a payload field"""
+        counts, offset = {}, None
+        while True:
+            records, offset = self.client.scroll(collection_name=collection, limit=1024, offset=offset, with_payload=[field], with_vectors=False)
+            for record in records:
+                value = record.payload.get(field)
+                counts[value] = counts.get(value, 0) + 1
+            if offset is None:
+                return counts
+
+    def points(self, collection: str, batch_size: int = 256):
+        """Yields (ids, dense, sparse, payloads) batches of every point, for copying collections"""
+        offset = None
+        while True:
+            records, offset = self.client.scroll(collection_name=collection, limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+            if records:
+                yield (
+                    [record.id for record in records],
+                    [np.asarray(record.vector[self.dense_name], dtype=np.float32) for record in records],
+                    [SparseVector(np.asarray(record.vector[self.sparse_name].indices), np.asarray(record.vector[self.sparse_name].values)) for record in records],
+                    [record.payload for record in records],
+                )
+            if offset is None:
+                return
+
+    def delete(self, collection: str, ids: list = None, filter: dict = None):
+        """Deletes points by id, or all the points matching a filter"""
+        from qdrant_client import models
+
+        selector = models.FilterSelector(filter=qdrant_filter(filter)) if filter else models.PointIdsList(points=ids)
+        self.client.delete(collection_name=collection, points_selector=selector)
+
+    def delete_collection(self, collection: str):
+        self.client.delete_collection(collection_name=collection)
+
+    @contextmanager
+    def writes(self, collection: str):
+        """Writes go straight to the server; see LocalBackend.writes"""
+        yield
+
+    async def close(self):
+        await self.async_client.close()
+        self.client.close()
+
+
+def qdrant_filter(filter: dict | None):
+    if not filter:
+        return None
+    from qdrant_client import models
+
+    conditions = []
+    for key, value in filter.items():
+        if isinstance(value, tuple):
+            conditions.append(models.FieldCondition(key=key, range=models.Range(gte=value[0], lte=value[1])))
+        elif isinstance(value, list):
+            conditions.append(models.FieldCondition(key=key, match=models.MatchAny(any=value)))
+        else:
+            conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=value)))
+    return models.Filter(must=conditions)
+
+
+def to_hit(point) -> Hit:
+    payload = point.payload or {}
+    return Hit(point.id, payload.get("document", ""), payload, getattr(point, "score", None))
+
+
+class LocalIndex:
+    """One collection held in memory-mapped NumPy arrays.
+
+    Dense vectors are kept in float32 for rescoring and as int8 codes for the
+    scan (the same 0.99 quantile scalar quantization as the Qdrant collections).
+    Sparse vectors are kept both as CSR rows and as an inverted index by term.
+    Filtered searches only scan the matching points, found from payload fields
+    loaded into arrays on first use."""
+
+    QUANTILE = 0.99
+    OVERSAMPLING = 4
+    ARRAYS = ("dense", "codes", "scale", "indptr", "indices", "values", "terms", "term_ptr", "post_docs", "post_values")
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "points.json")) as f:
+            points = json.load(f)
+        self.ids = points["ids"]
+        self.payloads = points["payloads"]
+        self.positions = {id: i for i, id in enumerate(self.ids)}
+        self.fields = {}
+
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    @classmethod
+    def write(cls, path: str, ids: list, payloads: list[dict], dense: np.ndarray, sparse: list[SparseVector]):
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        dense = np.asarray(dense, dtype=np.float32)
+        codes, scale = quantize(dense, cls.QUANTILE)
+
+        lengths = [len(vector.indices) for vector in sparse]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        indices = np.concatenate([vector.indices for vector in sparse]).astype(np.int64) if sparse else np.zeros(0, np.int64)
+        values = np.concatenate([vector.values for vector in sparse]).astype(np.float32) if sparse else np.zeros(0, np.float32)
+
+        # Inverted index: postings grouped by term
+        rows = np.repeat(np.arange(len(ids), dtype=np.int64), lengths)
+        order = np.argsort(indices, kind="stable")
+        terms, starts = np.unique(indices[order], return_index=True)
+
+        arrays = {
+            "dense": dense,
+            "codes": codes,
+            "scale": scale,
+            "indptr": indptr,
+            "indices": indices,
+            "values": values,
+            "terms": terms,
+            "term_ptr": np.append(starts, len(order)).astype(np.int64),
+            "post_docs": rows[order],
+            "post_values": values[order],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), array)
+        with open(os.path.join(tmp, "points.json"), "w") as f:
+            json.dump({"ids": ids, "payloads": payloads}, f)
+
+        old = path + ".old"
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def sparse_rows(self) -> list[SparseVector]:
+        return [
+            SparseVector(np.asarray(self.indices[start:end]), np.asarray(self.values[start:end]))
+            for start, end in zip(self.indptr[:-1], self.indptr[1:])
+        ]
+
+    def field(self, key: str) -> np.ndarray:
+        if key not in self.fields:
+            values = [payload.get(key) for payload in self.payloads]
+            if all(value is None or isinstance(value, (int, float)) for value in values):
+                self.fields[key] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            else:
+                self.fields[key] = np.array(values, dtype=object)
+        return self.fields[key]
+
+    def matching(self, filter: dict) -> np.ndarray:
+        """Positions of the points whose payload satisfies every condition"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, value in filter.items():
+            values = self.field(key)
+            if isinstance(value, tuple):
+                mask &= (values >= value[0]) & (values <= value[1])
+            elif isinstance(value, list):
+                mask &= np.isin(values, value)
+            else:
+                mask &= values == value
+        return np.flatnonzero(mask)
+
+    def search_dense(self, query, limit: int, positions: np.ndarray = None) -> list[tuple[int, float]]:
+        if not self.ids or (positions is not None and not len(positions)):
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+
+        # Approximate scores on int8 codes, then rescore the oversampled candidates exactly
+        alpha, offset = self.scale
+        codes = self.codes if positions is None else self.codes[positions]
+        approx = (codes @ query.astype(np.float32)) * alpha + offset * query.sum()
+        candidates = top_k(approx, limit * self.OVERSAMPLING)
+        if positions is not None:
+            candidates = positions[candidates]
+
+        vectors = np.asarray(self.dense[candidates])
+        exact = vectors @ query / np.linalg.norm(vectors, axis=1)
+        order = np.argsort(-exact)[:limit]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
+
+    def search_sparse(self, query: SparseVector, limit: int, positions: np.ndarray = None) -> list[tuple[int, float]]:
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        slots = np.searchsorted(self.terms, query.indices)
+
+        for slot, term, weight in zip(slots, query.indices, query.values):
+            if slot < len(self.terms) and self.terms[slot] == term:
+                start, end = self.term_ptr[slot], self.term_ptr[slot + 1]
+                np.add.at(scores, self.post_docs[start:end], weight * self.post_values[start:end])
+
+        # Like Qdrant, only points sharing at least one term are returned
+        matched = np.flatnonzero(scores) if positions is None else positions[scores[positions] != 0]
+        best = matched[top_k(scores[matched], limit)]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def hit(self, position: int, score: float = None) -> Hit:
+        payload = self.payloads[position]
+        return Hit(self.ids[position], payload.get("document", ""), payload, score)
+
+
+class LocalBackend:
+    """In-process replacement for QdrantBackend, one LocalIndex directory per collection.
+    Every write rewrites the collection's index, so bulk writes (a chapter's sync, a
+    migration) go through `writes`, which applies them with a single rewrite."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.indexes = {}
+        # Upserts and deletes buffered by `writes`, per collection
+        self.pending = {}
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, collection: str) -> str:
+        return os.path.join(self.root, collection)
+
+    def index(self, collection: str) -> LocalIndex:
+        if collection not in self.indexes:
+            self.indexes[collection] = LocalIndex(self.path(collection))
+        return self.indexes[collection]
+
+    def exists(self, collection: str) -> bool:
+        return os.path.exists(os.path.join(self.path(collection), "points.json"))
+
+    def collections(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.root) if self.exists(name))
+
+    def create(self, collection: str, dim: int):
+        LocalIndex.write(self.path(collection), [], [], np.zeros((0, dim), dtype=np.float32), [])
+        self.indexes.pop(collection, None)
+
+    def upsert(self, collection: str, ids: list, dense: list, sparse: list[SparseVector], payloads: list[dict]):
+        if ids:
+            self.write(collection, [("upsert", ids, dense, sparse, payloads)])
+
+    def search(self, collection: str, dense, sparse: SparseVector, limit: int = 10, filter: dict = None) -> list[Hit]:
+        index = self.index(collection)
+        positions = index.matching(filter) if filter else None
+        responses = [
+            [index.hit(i, score) for i, score in index.search_dense(dense, limit, positions)],
+            [index.hit(i, score) for i, score in index.search_sparse(sparse, limit, positions)],
+        ]
+        return reciprocal_rank_fusion(responses, limit=limit)
+
+    async def asearch(self, collection: str, dense, sparse: SparseVector, limit: int = 10, filter: dict = None) -> list[Hit]:
+        # NumPy releases the GIL for the scans, so a worker thread keeps the event loop free
+        return await asyncio.to_thread(self.search, collection, dense, sparse, limit, filter)
+
+    async def asearch_batch(self, collection: str, vectors: list, limit: int = 10, filter: dict = None) -> list[list[Hit]]:
+        # One worker thread for the whole batch; hits of the same point share its payload
+        return await asyncio.to_thread(lambda: [self.search(collection, dense, sparse, limit, filter) for dense, sparse in vectors])
+
+    def retrieve(self, collection: str, ids: list) -> list[Hit]:
+        index = self.index(collection)
+        return [index.hit(index.positions[id]) for id in ids if id in index.positions]
+
+    def count(self, collection: str, filter: dict = None) -> int:
+        index = self.index(collection)
+        return len(index.matching(filter)) if filter else len(index.ids)
+
+    def facet(self, collection: str, field: str) -> dict:
+        return dict(Counter(payload.get(field) for payload in self.index(collection).payloads))
+
+    def points(self, collection: str, batch_size: int = 256):
+        index = self.index(collection)
+        sparse = index.sparse_rows()
+        for start in range(0, len(index.ids), batch_size):
+            end = start + batch_size
+            yield index.ids[start:end], list(np.asarray(index.dense[start:end])), sparse[start:end], index.payloads[start:end]
+
+    def delete(self, collection: str, ids: list = None, filter: dict = None):
+        if ids is None:
+            # Filters are matched against the written index, so buffered writes go first
+            self.flush(collection)
+            index = self.index(collection)
+            ids = [index.ids[i] for i in index.matching(filter)]
+        self.write(collection, [("delete", ids)])
+
+    def delete_collection(self, collection: str):
+        self.indexes.pop(collection, None)
+        self.pending.pop(collection, None)
+        shutil.rmtree(self.path(collection), ignore_errors=True)
+
+    @contextmanager
+    def writes(self, collection: str):
+        """Buffers upserts and deletes to the collection and applies them in one
+        rewrite of the index on exit. Nothing is written if the block raises, and
+        searches see the previous index until then."""
+        if collection in self.pending:
+            yield
+            return
+        self.pending[collection] = []
+        try:
+            yield
+            self.flush(collection)
+        finally:
+            self.pending.pop(collection, None)
+
+    def write(self, collection: str, operations: list):
+        if collection in self.pending:
+            self.pending[collection] += operations
+        else:
+            self.apply(collection, operations)
+
+    def flush(self, collection: str):
+        if self.pending.get(collection):
+            operations, self.pending[collection] = self.pending[collection], []
+            self.apply(collection, operations)
+
+    def apply(self, collection: str, operations: list):
+        """Rewrites the index with the operations applied in order. Upserted points
+        go to the end, replacing any point with the same id."""
+        index = self.index(collection)
+        sparse = index.sparse_rows()
+        points = {id: (index.payloads[i], index.dense[i], sparse[i]) for i, id in enumerate(index.ids)}
+        for kind, ids, *vectors in operations:
+            for id in ids:
+                points.pop(id, None)
+            if kind == "upsert":
+                dense, sparse_vectors, payloads = vectors
+                points.update(zip(ids, zip(payloads, dense, sparse_vectors)))
+
+        dim = index.dense.shape[1]
+        LocalIndex.write(
+            self.path(collection),
+            list(points),
+            [payload for payload, _, _ in points.values()],
+            np.stack([dense for _, dense, _ in points.values()]).astype(np.float32) if points else np.zeros((0, dim), dtype=np.float32),
+            [vector for _, _, vector in points.values()],
+        )
+        self.indexes.pop(collection, None)
+
+    async def close(self):
+        pass
+
+
+def quantize(vectors: np.ndarray, quantile: float) -> tuple[np.ndarray, np.ndarray]:
+    """int8 codes with v ~= alpha * code + offset, clipping outliers beyond the quantile"""
+    if not vectors.size:
+        return np.zeros(vectors.shape, dtype=np.int8), np.array([1.0, 0.0], dtype=np.float32)
+
+    low, high = np.quantile(vectors, [(1 - quantile) / 2, (1 + quantile) / 2])
+    alpha = max(high - low, 1e-12) / 255
+    offset = low + 128 * alpha
+    codes = np.clip(np.round((vectors - offset) / alpha), -128, 127).astype(np.int8)
+    return codes, np.array([alpha, offset], dtype=np.float32)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def make_backend(name: str, **kwargs):
+    if name == "qdrant":
+        return QdrantBackend(**kwargs)
+    elif name == "local":
+        return LocalBackend(**kwargs)
+    raise ValueError(f"Unknown vector backend: {name}")
@@ -0,0 +1,90 @@
+"""Throughput of a worksheet answered one retriever call at a time against retriever_batch.
+
+    python -m benchmarks.batch_bench 9_science_11 [--backend local] [--queries 50] [--concurrency 4 8] [--fake-llm 0.8]
+
+"sequential" awaits agent.retriever for each query in turn, the way clients used
+to call /rag. "batch" runs agent.retriever_batch: the queries are embedded and
+searched together, then answered `concurrency` at a time. With --fake-llm the LLM
+is replaced by a fixed delay, to measure the rest of the pipeline without spending
+tokens. Every run uses distinct queries, so the answer cache never serves one.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+import agent
+from client import HybridClient
+from llm_client import llm_client
+
+QUERIES = Path(__file__).with_name("router_queries.jsonl")
+
+
+async def sequential(hclient, collection, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await agent.retriever(query, collection, hclient)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def batch(hclient, collection, queries, concurrency):
+    latencies = []
+    start = time.perf_counter()
+    async for _ in agent.retriever_batch([(query, collection) for query in queries], hclient, concurrency):
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(hclient, mode, collection, queries, concurrency=1):
+    start = time.perf_counter()
+    if mode == "sequential":
+        latencies = await sequential(hclient, collection, queries)
+    else:
+        latencies = await batch(hclient, collection, queries, concurrency)
+    wall = time.perf_counter() - start
+    # For batches, latency is the time until a query's line would have been sent
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(f"{mode:<10} c={concurrency:<3} {len(queries) / wall:7.2f} q/s  wall {wall:7.2f} s  p50 {p50:8.1f} ms  p95 {p95:8.1f} ms")
+
+
+async def main(collection, backend, count, concurrency, fake_llm):
+    hclient = HybridClient(backend)
+    texts = [json.loads(line)["query"] for line in QUERIES.read_text().splitlines() if line.strip()]
+
+    if fake_llm is not None:
+
+        async def chat(messages, **kwargs):
+            await asyncio.sleep(fake_llm)
+            return "answer"
+
+        llm_client.chat = chat
+    else:
+        await llm_client.start()
+
+    # Warm up (model sessions, connections)
+    await hclient.asearch(collection, texts[0])
+
+    modes = [("sequential", 1)] + [("batch", level) for level in concurrency]
+    for mode, level in modes:
+        queries = [f"{texts[i % len(texts)]} ({mode} {level} {i})" for i in range(count)]
+        await run(hclient, mode, collection, queries, level)
+    print(f"\nembedder: {hclient.embedder.stats()}")
+    await llm_client.close()
+    await hclient.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("collection")
+    parser.add_argument("--backend", default="local", choices=["local", "qdrant"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--fake-llm", type=float, default=None, help="seconds per LLM call, instead of calling the LLM")
+    args = parser.parse_args()
+    asyncio.run(main(args.collection, args.backend, args.queries, args.concurrency, args.fake_llm))
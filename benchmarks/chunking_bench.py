@@ -0,0 +1,91 @@
+"""Throughput and retrieval quality of the "layout" and "structural" chunkers.
+
+    python -m benchmarks.chunking_bench path/to/pdfs [--questions questions.jsonl] [--k 5]
+
+questions.jsonl has one {"pdf": "iesc111.pdf", "question": "...", "pages": [3]} per
+line. Retrieval quality is hit@k: the share of questions for which one of the
+top k chunks (dense MiniLM similarity) comes from an expected page.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pymupdf
+
+from preprocessing import chunk_blocks, count_tokens, get_chunks
+
+STRATEGIES = ("layout", "structural")
+
+
+def hit_at_k(model, chunks, questions, k):
+    vectors = np.array(list(model.passage_embed([chunk["text"] for chunk in chunks])))
+    hits = 0
+    for question in questions:
+        query = np.array(list(model.query_embed([question["question"]])))[0]
+        best = np.argsort(-(vectors @ query))[:k]
+        hits += any(chunks[i]["page"] in question["pages"] for i in best)
+    return hits
+
+
+def main(folder, questions_path, k):
+    questions = {}
+    if questions_path:
+        for line in Path(questions_path).read_text().splitlines():
+            if line.strip():
+                item = json.loads(line)
+                questions.setdefault(item["pdf"], []).append(item)
+
+    model = None
+    if questions:
+        from fastembed import TextEmbedding
+
+        from client import HybridClient
+
+        model = TextEmbedding(model_name=HybridClient.DENSE_MODEL)
+
+    pages = 0
+    extract_time = 0.0
+    results = {strategy: {"time": 0.0, "chunks": 0, "tokens": [], "hits": 0, "questions": 0} for strategy in STRATEGIES}
+
+    for path in sorted(Path(folder).glob("*.pdf")):
+        doc = pymupdf.open(path)
+        start = time.perf_counter()
+        blocks = get_chunks(doc)
+        extract_time += time.perf_counter() - start
+        pages += doc.page_count
+
+        for strategy in STRATEGIES:
+            start = time.perf_counter()
+            chunks = list(chunk_blocks([dict(block) for block in blocks], strategy))
+            result = results[strategy]
+            result["time"] += time.perf_counter() - start
+            result["chunks"] += len(chunks)
+            result["tokens"] += [count_tokens(chunk["text"]) for chunk in chunks]
+
+            if path.name in questions:
+                result["hits"] += hit_at_k(model, chunks, questions[path.name], k)
+                result["questions"] += len(questions[path.name])
+
+    if not pages:
+        print(f"No PDFs in {folder}")
+        return
+
+    print(f"{pages} pages, block extraction {pages / extract_time:.1f} pages/s\n")
+    for strategy, result in results.items():
+        tokens = np.array(result["tokens"])
+        line = f"{strategy:<11} {pages / (extract_time + result['time']):8.1f} pages/s  {result['chunks']:>6} chunks  tokens mean {tokens.mean():6.1f} max {tokens.max():5d}"
+        if result["questions"]:
+            line += f"  hit@{k} {result['hits'] / result['questions']:.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--questions", help="JSONL of questions with expected pages")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+    main(args.folder, args.questions, args.k)
@@ -0,0 +1,80 @@
+"""Parse time of scraper.PageParser (HTML to main-content blocks), the CPU part of
+web extraction, on saved pages or a generated article-like page.
+
+    python -m benchmarks.extract_bench [page.html ...] [--repeat 5] [--kb 300]
+
+The body is fed in 64 KiB pieces, as read_page does. BeautifulSoup (html.parser
+and lxml) is timed alongside when it is installed, for comparison.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scraper import PageParser, main_content
+
+
+def generated_page(kb):
+    """Navigation, an article of paragraphs with inline links, and a footer"""
+    nav = "<nav><ul>" + "".join(f'<li><a href="/p{i}">Section {i}</a></li>' for i in range(60)) + "</ul></nav>"
+    paragraph = (
+        "<p>Energy is the capacity to do work. When a <a href='/force'>force</a> moves an object, "
+        "work is done and <b>energy</b> is transferred; the SI unit of both is the joule &amp; "
+        "the rate of doing work is called <i>power</i>.</p>\n"
+    )
+    body = []
+    while sum(map(len, body)) < kb * 1024:
+        body.append(f"<h2>Heading {len(body)}</h2>\n" + paragraph * 8)
+    footer = "<footer>" + "".join(f"<a href='/f{i}'>Link {i}</a> " for i in range(40)) + "</footer>"
+    return f"<html><head><title>Work and energy</title><script>var x = 1;</script></head><body>{nav}<main><article>{''.join(body)}</article></main>{footer}</body></html>"
+
+
+def page_parser(html):
+    parser = PageParser()
+    for i in range(0, len(html), 64 * 1024):
+        parser.feed(html[i : i + 64 * 1024])
+    parser.close()
+    return main_content(parser.blocks)
+
+
+def timed(parse, html, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blocks = parse(html)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000, blocks
+
+
+def main(paths, repeat, kb):
+    pages = [(path, Path(path).read_text(errors="replace")) for path in paths] or [(f"generated {kb} KB", generated_page(kb))]
+    parsers = [("PageParser", page_parser)]
+    try:
+        from bs4 import BeautifulSoup
+
+        parsers.append(("bs4 html.parser", lambda html: BeautifulSoup(html, "html.parser").get_text()))
+        parsers.append(("bs4 lxml", lambda html: BeautifulSoup(html, "lxml").get_text()))
+    except ImportError:
+        pass
+
+    for name, html in pages:
+        print(f"{name}: {len(html.encode()) / 1024:.0f} KB")
+        for label, parse in parsers:
+            try:
+                ms, blocks = timed(parse, html, repeat)
+            except Exception as e:  # e.g. bs4 without lxml
+                print(f"  {label:<16} {e!r}")
+                continue
+            size = f"{len(blocks)} blocks" if isinstance(blocks, list) else f"{len(blocks)} chars"
+            print(f"  {label:<16} {ms:8.1f} ms  {len(html.encode()) / 1024 / ms:6.1f} MB/s  {size}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="saved HTML pages (default: a generated page)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--kb", type=int, default=300, help="size of the generated page")
+    args = parser.parse_args()
+    main(args.paths, args.repeat, args.kb)
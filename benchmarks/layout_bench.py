@@ -0,0 +1,111 @@
+"""Pages/sec and chunk output of preprocessing.get_chunks against the previous
+pure-Python implementation (kept below as the baseline).
+
+    python -m benchmarks.layout_bench path/to/pdfs [--repeat 3]
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pymupdf
+
+from preprocessing import clean_text, get_chunks
+
+
+def legacy_sort_text(chunks):
+    x_threshold = 300
+    left_column = [chunk for chunk in chunks if chunk["coordinates"][0] < x_threshold]
+    right_column = [chunk for chunk in chunks if chunk["coordinates"][0] >= x_threshold]
+    left_column = sorted(left_column, key=lambda item: item["coordinates"][1])
+    right_column = sorted(right_column, key=lambda item: item["coordinates"][1])
+    return left_column + right_column
+
+
+def legacy_majority_element(spans, param):
+    char_count = defaultdict(int)
+    for span in spans:
+        char_count[span[param]] += len(span["text"])
+    return max(char_count, key=char_count.get, default=None)
+
+
+def legacy_get_chunks(doc):
+    allchunks = []
+    for page_num in range(doc.page_count):
+        chunks = []
+        page = doc[page_num]
+        blocks = [i for i in page.get_text("dict")["blocks"] if "image" not in i]
+
+        for block in blocks:
+            text = ""
+            spans = []
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    if span["size"] > 9:
+                        text += span["text"] + " "
+                        spans.append(span)
+
+            if text.strip():
+                chunks.append(
+                    {
+                        "text": clean_text(text.strip()),
+                        "page": page_num,
+                        "coordinates": [round(block["bbox"][0], 1), round(block["bbox"][1], 1)],
+                        "color": legacy_majority_element(spans, "color"),
+                        "size": legacy_majority_element(spans, "size"),
+                    }
+                )
+        allchunks.extend(legacy_sort_text(chunks))
+    return allchunks
+
+
+def timed(function, doc, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = function(doc)
+        best = min(best, time.perf_counter() - start)
+    return chunks, best
+
+
+def main(folder, repeat):
+    pages = 0
+    totals = {"legacy": 0.0, "current": 0.0}
+    same_chunks = same_order = legacy_count = current_count = 0
+
+    for path in sorted(Path(folder).glob("*.pdf")):
+        doc = pymupdf.open(path)
+        legacy, legacy_time = timed(legacy_get_chunks, doc, repeat)
+        current, current_time = timed(get_chunks, doc, repeat)
+
+        pages += doc.page_count
+        totals["legacy"] += legacy_time
+        totals["current"] += current_time
+        legacy_count += len(legacy)
+        current_count += len(current)
+
+        # Same chunk set (ignoring order), and same reading order
+        key = lambda chunk: (chunk["page"], chunk["text"], chunk["color"], chunk["size"])
+        same_chunks += len(set(map(key, legacy)) & set(map(key, current)))
+        same_order += sum(key(a) == key(b) for a, b in zip(legacy, current))
+
+        print(f"{path.name:<20} {doc.page_count:>4} pages  legacy {legacy_time * 1000:8.1f} ms  current {current_time * 1000:8.1f} ms  chunks {len(legacy)} -> {len(current)}")
+
+    if not pages:
+        print(f"No PDFs in {folder}")
+        return
+
+    print()
+    for name, seconds in totals.items():
+        print(f"{name:<8} {pages / seconds:8.1f} pages/s")
+    print(f"speedup  {totals['legacy'] / totals['current']:8.2f}x")
+    print(f"chunks   {legacy_count} legacy, {current_count} current, {same_chunks} identical, {same_order} in the same position")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.folder, args.repeat)
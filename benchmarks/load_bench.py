@@ -0,0 +1,81 @@
+"""Concurrent retrieval throughput of the blocking search path against the async one.
+
+    python -m benchmarks.load_bench 9_science_11 [--backend local] [--requests 200] [--concurrency 1 8 32]
+
+"blocking" calls HybridClient.search from coroutines, the way the request path
+used to, so embedding and the vector store call stall the event loop. "async" uses
+HybridClient.asearch: queries are embedded in batches on the embedder thread and
+the backend call is awaited. Loop lag is the worst delay seen by a 10 ms ticker,
+i.e. how long other requests (and streaming responses) were frozen.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from client import HybridClient
+
+QUERIES = Path(__file__).with_name("router_queries.jsonl")
+
+
+async def ticker(ticks, interval=0.01):
+    while True:
+        ticks.append(time.perf_counter())
+        await asyncio.sleep(interval)
+
+
+async def run(hclient, mode, collection, queries, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ticks = [], []
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "blocking":
+                hclient.search(collection, query)
+            else:
+                await hclient.asearch(collection, query)
+            latencies.append(time.perf_counter() - start)
+
+    tick = asyncio.create_task(ticker(ticks))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    # Distinct strings per request, so nothing can be served from a cache
+    await asyncio.gather(*(one(f"{queries[i % len(queries)]} ({mode} {concurrency} {i})") for i in range(requests)))
+    wall = time.perf_counter() - start
+    tick.cancel()
+    # The gap up to the end counts too: a blocked loop never lets the ticker run again
+    ticks.append(time.perf_counter())
+
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    lag = max(np.diff(ticks).max() - 0.01, 0.0) * 1000
+    print(f"{mode:<9} c={concurrency:<3} {requests / wall:7.1f} req/s  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  loop lag max {lag:7.1f} ms")
+
+
+async def main(collection, backend, requests, concurrency):
+    hclient = HybridClient(backend)
+    queries = [json.loads(line)["query"] for line in QUERIES.read_text().splitlines() if line.strip()]
+
+    # Warm up both paths (model sessions, connections)
+    hclient.search(collection, queries[0])
+    await hclient.asearch(collection, queries[0])
+
+    for level in concurrency:
+        for mode in ("blocking", "async"):
+            await run(hclient, mode, collection, queries, requests, level)
+    print(f"\nembedder: {hclient.embedder.stats()}")
+    await hclient.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("collection")
+    parser.add_argument("--backend", default="local", choices=["local", "qdrant"])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+    asyncio.run(main(args.collection, args.backend, args.requests, args.concurrency))
@@ -0,0 +1,87 @@
+"""Routing accuracy and latency of the local router against the labelled query set.
+
+    python -m benchmarks.router_bench [--llm] [--collection 9_science_11]
+
+A fast-pathed query counts as correct only if its function and any "source",
+"dest" and "url" the query set gives match what the router extracted; a null
+source means the query must not be fast-pathed with literal text (it refers to
+the lesson or earlier context).
+
+With --llm every query is also sent through call_agent, so the latency saved
+by fast-pathed queries (LLM router time minus local routing time) can be reported.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from agent import call_agent
+from client import HybridClient
+from router import router
+
+QUERIES = Path(__file__).with_name("router_queries.jsonl")
+
+
+def matches(result, item):
+    if result["function"] != item["function"]:
+        return False
+    if "source" in item and result["source"] != (item["source"] or "none"):
+        return False
+    if "dest" in item and result["dest_lang"] != item["dest"]:
+        return False
+    return "url" not in item or result["url"] == item["url"]
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+
+
+async def main(collection, use_llm):
+    hclient = HybridClient()
+    queries = [json.loads(line) for line in QUERIES.read_text().splitlines() if line.strip()]
+    router.fit(hclient)
+
+    routed, correct, local_times, saved = 0, 0, [], []
+    for item in queries:
+        start = time.perf_counter()
+        result = await router.route(item["query"], hclient)
+        local = time.perf_counter() - start
+        local_times.append(local)
+
+        if result:
+            routed += 1
+            correct += matches(result, item)
+
+        if use_llm:
+            start = time.perf_counter()
+            await call_agent(item["query"], collection)
+            remote = time.perf_counter() - start
+            # Fallbacks pay for the local stage on top of the LLM router
+            saved.append(remote - local if result else -local)
+
+        label = result["function"] if result else "fallback"
+        mark = "x" if result and not matches(result, item) else " "
+        print(f"{mark} {item['function']:>10} -> {label:<10} {local * 1000:6.1f} ms  {item['query']}")
+
+    print()
+    print(f"queries:           {len(queries)}")
+    print(f"fast-pathed:       {routed} ({routed / len(queries):.0%})")
+    print(f"fast-path accuracy: {correct}/{routed} ({correct / routed if routed else 0:.0%})")
+    print(f"local routing:     {percentiles(local_times)}")
+    if use_llm:
+        print(f"latency saved:     {percentiles(saved)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default="9_science_11")
+    parser.add_argument("--llm", action="store_true", help="also time the LLM router to report latency saved")
+    args = parser.parse_args()
+    asyncio.run(main(args.collection, args.llm))
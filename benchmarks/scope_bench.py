@@ -0,0 +1,73 @@
+"""Search latency per chapter collection against the same chapters as filters on
+the book's collection, plus whole-book search.
+
+    python migrate.py --grade 9 --subject science
+    python -m benchmarks.scope_bench 9 science [--backend local] [--requests 200]
+
+"chapter" searches 9_science_<n> with COLLECTION_LAYOUT=chapter, "subject" the
+same names with COLLECTION_LAYOUT=subject (9_science filtered by chapter), and
+"book" the whole of 9_science. Every run asks the same queries with an empty
+embedding cache, and the chapter and subject runs are checked to return the same hits.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from client import HybridClient
+from registry import parse_collection
+
+QUERIES = Path(__file__).with_name("router_queries.jsonl")
+
+
+async def run(hclient, mode, collections, queries):
+    latencies, results = [], []
+    hclient.embedder.cache.clear()
+    for i, query in enumerate(queries):
+        collection = collections[i % len(collections)]
+        start = time.perf_counter()
+        hits = await hclient.asearch(collection, query)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit.id for hit in hits])
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(f"{mode:<8} {len(queries) / sum(latencies):8.1f} q/s  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+    return results
+
+
+async def main(grade, subject, backend, requests):
+    hclient = HybridClient(backend)
+    book = f"{grade}_{subject}"
+    collections = [name for name in hclient.backend.collections() if (parse_collection(name) or ())[:2] == (grade, subject)]
+    collections.sort(key=lambda name: int(parse_collection(name)[2]))
+    texts = [json.loads(line)["query"] for line in QUERIES.read_text().splitlines() if line.strip()]
+    queries = [f"{texts[i % len(texts)]} ({i})" for i in range(requests)]
+
+    # Warm up (model sessions, connections, memory-mapped pages)
+    for layout in ("chapter", "subject"):
+        hclient.layout = layout
+        for collection in collections:
+            await hclient.asearch(collection, texts[0])
+
+    hclient.layout = "chapter"
+    per_chapter = await run(hclient, "chapter", collections, queries)
+    hclient.layout = "subject"
+    filtered = await run(hclient, "subject", collections, queries)
+    await run(hclient, "book", [book], queries)
+
+    same = np.mean([set(a) == set(b) for a, b in zip(per_chapter, filtered)])
+    print(f"\n{len(collections)} chapters, {hclient.backend.count(book)} points in {book}; same hits for {same:.0%} of queries")
+    await hclient.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("grade")
+    parser.add_argument("subject")
+    parser.add_argument("--backend", default="local", choices=["local", "qdrant"])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.grade, args.subject.lower(), args.backend, args.requests))
@@ -0,0 +1,71 @@
+"""Cold import time of the entry points, and time until the API reports ready.
+
+    python -m benchmarks.startup_bench [--runs 5] [--modules api ui app agent] [--no-ready]
+
+Each import runs in a fresh interpreter, best of --runs. Time to ready starts a
+fresh interpreter that imports api, runs its lifespan and polls /ready, so it
+includes loading and warming up the embedding models, router and reranker.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+READY = """
+import asyncio, time
+start = time.perf_counter()
+from api import app
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        while not app.state.ready:
+            if time.perf_counter() - start > 600:
+                raise SystemExit("not ready after 600 s, see the warmup log")
+            await asyncio.sleep(0.01)
+        print(imported - start, time.perf_counter() - start)
+
+asyncio.run(main())
+"""
+
+
+def import_time(module, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode:
+            return None, result.stderr.strip().splitlines()[-1]
+        best = elapsed if best is None else min(best, elapsed)
+    return best, None
+
+
+def main(modules, runs, ready):
+    baseline, _ = import_time("sys", runs)
+    print(f"interpreter startup: {baseline * 1000:.0f} ms (subtracted below)")
+
+    for module in modules:
+        elapsed, error = import_time(module, runs)
+        if error:
+            print(f"import {module:<8} failed: {error}")
+        else:
+            print(f"import {module:<8} {(elapsed - baseline) * 1000:7.0f} ms")
+
+    if ready:
+        result = subprocess.run([sys.executable, "-c", READY], capture_output=True, text=True)
+        if result.returncode:
+            print(f"time to ready failed: {result.stderr.strip().splitlines()[-1]}")
+            return
+        imported, total = map(float, result.stdout.split()[-2:])
+        print(f"time to ready: {total:.2f} s (import {imported:.2f} s, warmup {total - imported:.2f} s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=["api", "ui", "app", "agent"])
+    parser.add_argument("--no-ready", dest="ready", action="store_false")
+    args = parser.parse_args()
+    main(args.modules, args.runs, args.ready)
@@ -0,0 +1,57 @@
+"""Local stand-in for ncert.nic.in, serving a folder of chapter PDFs.
+
+    python -m benchmarks.stub_ncert path/to/pdfs --port 8080
+    NCERT_BASE_URL=http://localhost:8080 python ingest.py 9 science
+
+Files are served at /textbook/pdf/<name>.pdf with ETag and Last-Modified
+validators, HEAD and 304 support, and a request log to check what the
+scraper actually downloaded.
+"""
+
+import argparse
+import hashlib
+import os
+from email.utils import formatdate
+
+from aiohttp import web
+
+
+def make_app(root: str) -> web.Application:
+    log = []
+
+    async def serve(request: web.Request):
+        path = os.path.join(root, request.match_info["name"])
+        if not os.path.isfile(path):
+            log.append((request.method, request.path, 404))
+            raise web.HTTPNotFound()
+
+        with open(path, "rb") as f:
+            data = f.read()
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        headers = {"ETag": etag, "Last-Modified": formatdate(os.path.getmtime(path), usegmt=True)}
+
+        if request.headers.get("If-None-Match") == etag:
+            log.append((request.method, request.path, 304))
+            return web.Response(status=304, headers=headers)
+
+        log.append((request.method, request.path, 200))
+        if request.method == "HEAD":
+            return web.Response(headers=headers | {"Content-Length": str(len(data))})
+        return web.Response(body=data, content_type="application/pdf", headers=headers)
+
+    async def requests_log(request: web.Request):
+        return web.json_response(log)
+
+    app = web.Application()
+    app.router.add_route("GET", "/textbook/pdf/{name}", serve)
+    app.router.add_route("HEAD", "/textbook/pdf/{name}", serve)
+    app.router.add_get("/log", requests_log)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="folder of PDFs named like iesc101.pdf")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(make_app(args.root), port=args.port)
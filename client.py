@@ -1,67 +1,258 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import uuid
+from functools import cached_property
 
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient, models
+
+from backends import make_backend
+from config import COLLECTION_LAYOUT, LOCAL_INDEX_DIR, MANIFEST_DIR, QDRANT_URL, VECTOR_BACKEND
+from embedder import Embedder
+from logs import fields
+from metrics import Span
+from registry import chapter_title, parse_collection, parse_scope, registry
 
 load_dotenv()
+log = logging.getLogger(__name__)
 
 
 class HybridClient:
+    """Collections are named by chapter ("9_science_1") everywhere else. With the
+    subject layout they are stored in one collection per book ("9_science"), and
+    `locate` turns the name into the book collection and a payload filter, which
+    also makes chapter ranges ("9_science_3-5") and whole books ("9_science")
+    searchable."""
     DENSE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
     SPARSE_MODEL = "prithivida/Splade_PP_en_v1"
+    DENSE_DIM = 384
 
-    def __init__(self):
-        self.qdrant_client = QdrantClient(
-            url="https://e8c7892c-84a5-4b73-9281-27d52258c6d8.europe-west3-0.gcp.cloud.qdrant.io:6333",
-            api_key=os.getenv("QDRANT_API_KEY"),
-        )
-        self.qdrant_client.set_model(self.DENSE_MODEL)
-        self.qdrant_client.set_sparse_model(self.SPARSE_MODEL)
+    # Vector names used by qdrant_client's fastembed integration, which created the existing collections
+    DENSE_VECTOR = "fast-" + DENSE_MODEL.split("/")[-1].lower()
+    SPARSE_VECTOR = "fast-sparse-" + SPARSE_MODEL.split("/")[-1].lower()
 
-    def create(self, collection: str):
-        if not self.qdrant_client.collection_exists(collection):
-            self.qdrant_client.create_collection(
-                collection_name=collection,
-                vectors_config=self.qdrant_client.get_fastembed_vector_params(),
-                sparse_vectors_config=self.qdrant_client.get_fastembed_sparse_vector_params(),
-                quantization_config=models.ScalarQuantization(
-                    scalar=models.ScalarQuantizationConfig(
-                        type=models.ScalarType.INT8,
-                        quantile=0.99,
-                        always_ram=False,
-                    ),
-                ),
+    def __init__(self, backend: str = VECTOR_BACKEND, layout: str = COLLECTION_LAYOUT):
+        # The backend and models are created on first use (or by warmup), so constructing a client is free
+        self.backend_name = backend
+        self.layout = layout
+        # Called with the collection name after every insert, e.g. to invalidate caches
+        self.on_insert = []
+
+    @cached_property
+    def backend(self):
+        if self.backend_name == "qdrant":
+            return make_backend(
+                self.backend_name,
+                url=QDRANT_URL,
+                api_key=os.getenv("QDRANT_API_KEY"),
+                dense_name=self.DENSE_VECTOR,
+                sparse_name=self.SPARSE_VECTOR,
             )
-            print(f"--- {collection} collection created")
+        return make_backend(self.backend_name, root=LOCAL_INDEX_DIR)
+
+    @cached_property
+    def dense_model(self):
+        from fastembed import TextEmbedding
+
+        return TextEmbedding(model_name=self.DENSE_MODEL)
+
+    @cached_property
+    def sparse_model(self):
+        from fastembed import SparseTextEmbedding
+
+        return SparseTextEmbedding(model_name=self.SPARSE_MODEL)
+
+    @cached_property
+    def embedder(self):
+        return Embedder(self.dense_model, self.sparse_model)
+
+    def warmup(self):
+        """Loads the backend and models and runs one inference, so the first request pays for neither"""
+        self.backend
+        self.embedder.run(["warmup"])
+
+    def locate(self, collection: str, filter: dict = None) -> tuple[str, dict | None]:
+        """Stored collection and payload filter for a collection name"""
+        scope = parse_scope(collection)
+        if self.layout != "subject" or scope is None:
+            return collection, filter
+        grade, subject, first, last = scope
+        conditions = {} if first is None else {"chapter": first if first == last else (first, last)}
+        return f"{grade}_{subject}", {**conditions, **(filter or {})} or None
+
+    def create(self, collection: str):
+        collection, _ = self.locate(collection)
+        if not self.backend.exists(collection):
+            self.backend.create(collection, self.DENSE_DIM)
+            log.info("collection created", extra=fields(collection=collection))
             return collection
         return None
 
     def insert(self, collection, chunks):
-        documents = []
+        ids, documents, payloads = self.prepare(collection, chunks)
+        self.upsert(collection, ids, documents, payloads)
+        log.info("chunks inserted", extra=fields(collection=collection, count=len(ids)))
+
+    def sync(self, collection, chunks, batch_size: int = 64) -> dict:
+        """Makes the collection match chunks, embedding only chunks that are not
+        in the collection's manifest and deleting the ones that disappeared.
+        Chunks may be a generator; they are embedded a batch at a time as they arrive."""
+        manifest = self.read_manifest(collection)
+        stored, filter = self.locate(collection)
+
+        # Manifests are only trusted while the backend still holds exactly their points; a
+        # deleted collection, another backend or another layout means a full re-embed
+        if manifest is not None:
+            count = self.backend.count(stored, filter) if self.backend.exists(stored) else 0
+            if count != len(manifest):
+                log.warning("manifest out of date, re-embedding", extra=fields(collection=collection, manifest=len(manifest), stored=count))
+                manifest = None
+
+        # Collections indexed before manifests existed have random ids and would be duplicated
+        if manifest is None and self.backend.exists(stored) and self.backend.count(stored, filter):
+            if filter:
+                self.backend.delete(stored, filter=filter)
+            else:
+                self.backend.delete_collection(stored)
+        self.create(collection)
+
+        # Chunks arrive in page order, so the title is among the first page's
+        first_page = []
+
+        def track(chunks):
+            for chunk in chunks:
+                if not first_page or chunk.get("page", 0) == first_page[0].get("page", 0):
+                    first_page.append(chunk)
+                yield chunk
+
+        known = set(manifest or [])
+        ids, new, batch = [], 0, []
+        # Batches are embedded as chunks arrive; the local backend applies them with one write at the end
+        with self.backend.writes(stored):
+            for point in self.points(collection, track(chunks)):
+                ids.append(point[0])
+                if point[0] not in known:
+                    batch.append(point)
+                if len(batch) == batch_size:
+                    self.upsert(collection, *map(list, zip(*batch)))
+                    new, batch = new + len(batch), []
+            if batch:
+                self.upsert(collection, *map(list, zip(*batch)))
+                new += len(batch)
+
+            stale = list(known - set(ids))
+            if stale:
+                self.backend.delete(stored, stale)
+        if new or stale:
+            self.inserted(collection)
+
+        self.write_manifest(collection, ids)
+        registry.record(collection, chapter_title(first_page), len(ids))
+        return {"added": new, "removed": len(stale), "unchanged": len(ids) - new}
+
+    def prepare(self, collection, chunks):
+        """Splits chunks into deterministic ids, documents and payloads, dropping duplicates"""
+        points = list(self.points(collection, chunks))
+        return [id for id, _, _ in points], [document for _, document, _ in points], [payload for _, _, payload in points]
+
+    def points(self, collection, chunks):
+        """Yields (id, document, payload) per chunk, skipping duplicates. Payloads
+        carry the chapter's grade, subject and number, for filtered search."""
+        parsed = parse_collection(collection)
+        location = {"grade": int(parsed[0]), "subject": parsed[1], "chapter": int(parsed[2])} if parsed else {}
+        seen = set()
         for chunk in chunks:
-            documents.append(chunk.pop("text"))
-            chunk.pop("color")
-            chunk.pop("size")
-
-        self.qdrant_client.add(
-            collection_name=collection,
-            documents=documents,
-            metadata=chunks,
-            parallel=0,
-        )
-        print("--- pdf inserted")
-
-    def search(self, collection, text: str, limit: int = 10):
-        search_result = self.qdrant_client.query(
-            collection_name=collection,
-            query_text=text,
-            query_filter=None,
-            limit=limit,
-        )
-        # Select and return metadata
-        # metadata = [hit.metadata for hit in search_result]
-        return search_result
-
-    def get_chapter_name(self, collection: str):
-        points = self.qdrant_client.retrieve(collection_name=collection, ids=[0])
-        return points[0]
+            document = chunk["text"]
+            payload = {key: value for key, value in chunk.items() if key not in ("text", "color", "size", "section_size")}
+            # The id is computed before the location fields are added, so it stays the same across layouts
+            id = chunk_id(collection, document, payload)
+            if id not in seen:
+                seen.add(id)
+                yield id, document, {"document": document, **payload, **location}
+
+    def upsert(self, collection, ids, documents, payloads):
+        dense, sparse = self.embedder.embed_passages(documents)
+        self.backend.upsert(self.locate(collection)[0], ids, dense, sparse, payloads)
+        self.inserted(collection)
+
+    def inserted(self, collection):
+        for callback in self.on_insert:
+            callback(collection)
+
+    def read_manifest(self, collection) -> list | None:
+        path = os.path.join(MANIFEST_DIR, f"{collection}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)["ids"]
+
+    def write_manifest(self, collection, ids):
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        path = os.path.join(MANIFEST_DIR, f"{collection}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"ids": ids}, f)
+        os.replace(path + ".tmp", path)
+
+    def search(self, collection, text: str, limit: int = 10, filter: dict = None):
+        collection, filter = self.locate(collection, filter)
+        with Span("search"):
+            with Span("embed"):
+                dense, sparse = self.embedder.run([text])[0]
+            with Span("vector_search") as span:
+                hits = self.backend.search(collection, dense, sparse, limit=limit, filter=filter)
+                span.size("out", sum(len(hit.document) for hit in hits))
+            return hits
+
+    def embed(self, texts: list[str]) -> list:
+        """Dense query embeddings"""
+        return list(self.dense_model.query_embed(texts))
+
+    async def asearch(self, collection, text: str, limit: int = 10, filter: dict = None):
+        """search for the request path: embedding runs batched on the embedder's
+        thread and the backend query does not block the event loop"""
+        collection, filter = self.locate(collection, filter)
+        with Span("search"):
+            with Span("embed"):
+                dense, sparse = await self.embedder.embed(text)
+            with Span("vector_search") as span:
+                hits = await self.backend.asearch(collection, dense, sparse, limit=limit, filter=filter)
+                span.size("out", sum(len(hit.document) for hit in hits))
+            return hits
+
+    async def asearch_batch(self, collection, texts: list[str], limit: int = 10, filter: dict = None) -> list[list]:
+        """asearch for many queries over one collection. Submitted together, the
+        queries are embedded in as few batches as the embedder allows, and searched
+        in one backend call."""
+        collection, filter = self.locate(collection, filter)
+        with Span("search"):
+            with Span("embed"):
+                vectors = await asyncio.gather(*(self.embedder.embed(text) for text in texts))
+            with Span("vector_search") as span:
+                hits = await self.backend.asearch_batch(collection, vectors, limit=limit, filter=filter)
+                span.size("out", sum(len(hit.document) for batch in hits for hit in batch))
+            return hits
+
+    async def aembed(self, text: str):
+        """Dense query embedding, off the event loop"""
+        with Span("embed"):
+            dense, _ = await self.embedder.embed(text)
+        return dense
+
+    async def aembed_passages(self, texts: list[str]) -> list:
+        """Dense passage embeddings, off the event loop"""
+        with Span("embed"):
+            return await self.embedder.embed_documents(texts)
+
+    async def close(self):
+        if "backend" in self.__dict__:
+            await self.backend.close()
+
+
+def chunk_id(collection: str, text: str, chunk: dict) -> str:
+    """Stable id from the chunk's location and content, so re-indexing overwrites
+    instead of duplicating"""
+    digest = hashlib.sha1(text.encode()).hexdigest()
+    key = f"{collection}|{chunk.get('page')}|{chunk.get('coordinates')}|{digest}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
@@ -0,0 +1,108 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# LLM
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+
+# (requests per minute, tokens per minute), matching the Groq account limits. Keyed by model;
+# models without an entry (e.g. passed to llm_client.chat explicitly) get LLM_RATE_LIMIT
+LLM_RATE_LIMIT = (int(os.getenv("LLM_RPM", 30)), int(os.getenv("LLM_TPM", 6000)))
+LLM_RATE_LIMITS = {LLM_MODEL: LLM_RATE_LIMIT}
+
+# Local intent router (see router.py); queries below these thresholds fall back to the LLM router
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", 0.3))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", 0.1))
+
+# Semantic answer cache (see semantic_cache.py)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 24 * 60 * 60))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Vector store: "qdrant" (remote Qdrant Cloud) or "local" (in-process, memory-mapped files under LOCAL_INDEX_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+QDRANT_URL = os.getenv("QDRANT_URL", "https://e8c7892c-84a5-4b73-9281-27d52258c6d8.europe-west3-0.gcp.cloud.qdrant.io:6333")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "index")
+# "chapter": one collection per chapter (9_science_1). "subject": one per book (9_science), chapters
+# selected by payload filters, which also allows chapter ranges and whole-book search (see migrate.py)
+COLLECTION_LAYOUT = os.getenv("COLLECTION_LAYOUT", "chapter")
+
+# Ingestion
+NCERT_BASE_URL = os.getenv("NCERT_BASE_URL", "https://ncert.nic.in")
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+# Chunk ids per collection, used to re-embed only changed chunks
+MANIFEST_DIR = os.getenv("MANIFEST_DIR", "manifests")
+
+# Chunking: "layout" (one chunk per text block, activities grouped) or "structural" (token-bounded sections)
+CHUNKER = os.getenv("CHUNKER", "layout")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 256))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 32))
+
+# Sarvam translation / text-to-speech API
+SARVAM_MAX_CONCURRENCY = int(os.getenv("SARVAM_MAX_CONCURRENCY", 8))
+SARVAM_TIMEOUT = float(os.getenv("SARVAM_TIMEOUT", 30))
+SARVAM_MAX_RETRIES = int(os.getenv("SARVAM_MAX_RETRIES", 3))
+
+# Persistent translation / TTS cache (see speech_cache.py)
+SPEECH_CACHE_DIR = os.getenv("SPEECH_CACHE_DIR", "speech_cache")
+SPEECH_CACHE_MAX_TRANSLATIONS = int(os.getenv("SPEECH_CACHE_MAX_TRANSLATIONS", 100_000))
+
+# Synthesized audio clips (see audio_store.py), served from /audio/{name}
+AUDIO_DIR = os.getenv("AUDIO_DIR", "audio_files")
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", 512 * 1024 * 1024))
+AUDIO_MAX_AGE = float(os.getenv("AUDIO_MAX_AGE", 7 * 24 * 60 * 60))
+AUDIO_CLEANUP_INTERVAL = float(os.getenv("AUDIO_CLEANUP_INTERVAL", 10 * 60))
+
+# Chapter registry (see registry.py), written at ingestion and loaded by the API
+REGISTRY_PATH = os.getenv("REGISTRY_PATH", "registry.json")
+REGISTRY_REFRESH_INTERVAL = float(os.getenv("REGISTRY_REFRESH_INTERVAL", 30))
+
+# Retrieval: candidates fetched per query, then reranked, deduplicated and packed into the prompt (see rerank.py)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "1") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+RERANK_MODEL_FILE = os.getenv("RERANK_MODEL_FILE", "onnx/model_quantized.onnx")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 30))
+RERANK_DEDUP_THRESHOLD = float(os.getenv("RERANK_DEDUP_THRESHOLD", 0.8))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", 1500))
+
+# Embedding scheduler (see embedder.py): queries arriving within EMBED_MAX_WAIT seconds are embedded as one batch
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 32))
+EMBED_MAX_WAIT = float(os.getenv("EMBED_MAX_WAIT", 0.005))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))
+EMBED_PASSAGE_BATCH = int(os.getenv("EMBED_PASSAGE_BATCH", 32))
+
+# Logging (see logs.py): the most recent LOG_BUFFER_SIZE records are kept for the debug modal
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 500))
+
+# Metrics (see metrics.py): with SERVER_TIMING=1 responses carry a per-stage Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Web extraction (see scraper.extract): pages are read up to EXTRACT_MAX_BYTES and reduced to EXTRACT_CONTEXT_TOKENS
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", 2 * 1024 * 1024))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", 10))
+EXTRACT_CONTEXT_TOKENS = int(os.getenv("EXTRACT_CONTEXT_TOKENS", 2000))
+EXTRACT_PASSAGE_TOKENS = int(os.getenv("EXTRACT_PASSAGE_TOKENS", 120))
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "page_cache")
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", 60 * 60))
+PAGE_CACHE_MAX_PAGES = int(os.getenv("PAGE_CACHE_MAX_PAGES", 1000))
+
+# Session memory (see memory.py): the last MEMORY_TURNS turns are kept verbatim, older ones are summarized
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", 1000))
+MEMORY_IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", 60 * 60))
+MEMORY_TURNS = int(os.getenv("MEMORY_TURNS", 4))
+MEMORY_SUMMARY_WORDS = int(os.getenv("MEMORY_SUMMARY_WORDS", 150))
+MEMORY_TOPIC_THRESHOLD = float(os.getenv("MEMORY_TOPIC_THRESHOLD", 0.6))
+
+# Speculation: while the LLM router decides, "search" starts retrieval and "answer" also the RAG answer; "off" waits
+SPECULATION = os.getenv("SPECULATION", "search")
+
+# Batch endpoints (/rag/batch, /agent/batch): at most BATCH_CONCURRENCY answers are generated at once per batch
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 200))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
@@ -0,0 +1,131 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import SparseVector
+from config import EMBED_CACHE_SIZE, EMBED_MAX_BATCH, EMBED_MAX_WAIT, EMBED_PASSAGE_BATCH
+
+
+class Embedder:
+    """Runs dense and sparse inference on one dedicated thread, for queries and
+    ingestion alike, so it never blocks the event loop or oversubscribes the CPU.
+
+    Queries that arrive while a batch is running, or within `max_wait` seconds of
+    each other, are embedded together as one batched inference per model. Recent
+    query embeddings are kept in an LRU cache, and identical queries in flight
+    share one computation. Passage batches for ingestion go through the same
+    thread, so queries are interleaved with them instead of queueing behind a
+    whole book."""
+
+    def __init__(
+        self,
+        dense_model,
+        sparse_model,
+        max_batch: int = EMBED_MAX_BATCH,
+        max_wait: float = EMBED_MAX_WAIT,
+        cache_size: int = EMBED_CACHE_SIZE,
+        passage_batch: int = EMBED_PASSAGE_BATCH,
+    ):
+        self.dense_model = dense_model
+        self.sparse_model = sparse_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.passage_batch = passage_batch
+        # One thread: batches run back to back, and onnxruntime parallelizes each one internally
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+        self.cache = OrderedDict()  # query -> (dense, sparse), in LRU order
+        self.inflight = {}  # query -> future, for queries that are pending or running
+        self.pending = []
+        self.timer = None
+        self.running = False
+        self.counters = {"queries": 0, "cache_hits": 0, "coalesced": 0, "batches": 0, "embedded": 0, "passages": 0}
+
+    async def embed(self, text: str):
+        """(dense vector, SparseVector) for one query"""
+        self.counters["queries"] += 1
+        if text in self.cache:
+            self.cache.move_to_end(text)
+            self.counters["cache_hits"] += 1
+            return self.cache[text]
+        if text in self.inflight:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(self.inflight[text])
+
+        loop = asyncio.get_running_loop()
+        self.inflight[text] = loop.create_future()
+        self.pending.append(text)
+
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None and not self.running:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+        return await asyncio.shield(self.inflight[text])
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # The running batch flushes again when it finishes
+        if self.running or not self.pending:
+            return
+
+        batch, self.pending = self.pending[: self.max_batch], self.pending[self.max_batch :]
+        self.running = True
+        self.counters["batches"] += 1
+        self.counters["embedded"] += len(batch)
+        task = asyncio.get_running_loop().run_in_executor(self.executor, self.run, batch)
+        task.add_done_callback(lambda done: self.finish(batch, done))
+
+    def finish(self, batch, done):
+        self.running = False
+        error = done.exception()
+        for i, text in enumerate(batch):
+            future = self.inflight.pop(text)
+            if error:
+                future.set_exception(error)
+                continue
+            future.set_result(done.result()[i])
+            self.cache[text] = done.result()[i]
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        if self.pending:
+            self.flush()
+
+    def run(self, texts: list[str]) -> list:
+        dense = list(self.dense_model.query_embed(texts))
+        sparse = [SparseVector(vector.indices, vector.values) for vector in self.sparse_model.embed(texts)]
+        return list(zip(dense, sparse))
+
+    def embed_passages(self, texts: list[str]) -> tuple[list, list[SparseVector]]:
+        """Dense and sparse passage embeddings for ingestion. Blocking; runs in
+        batches of `passage_batch` on the embedder thread."""
+        dense, sparse = [], []
+        for start in range(0, len(texts), self.passage_batch):
+            batch_dense, batch_sparse = self.executor.submit(self.run_passages, texts[start : start + self.passage_batch]).result()
+            dense += batch_dense
+            sparse += batch_sparse
+        self.counters["passages"] += len(texts)
+        return dense, sparse
+
+    async def embed_documents(self, texts: list[str]) -> list:
+        """Dense passage embeddings for text that is ranked but not indexed (web
+        pages), computed on the embedder thread without blocking the event loop"""
+        dense = await asyncio.get_running_loop().run_in_executor(self.executor, lambda: list(self.dense_model.passage_embed(texts)))
+        self.counters["passages"] += len(texts)
+        return dense
+
+    def run_passages(self, texts: list[str]):
+        dense = list(self.dense_model.passage_embed(texts))
+        sparse = [SparseVector(vector.indices, vector.values) for vector in self.sparse_model.embed(texts)]
+        return dense, sparse
+
+    def stats(self) -> dict:
+        batches = self.counters["batches"]
+        queries = self.counters["queries"]
+        return self.counters | {
+            "batch_avg": self.counters["embedded"] / batches if batches else 0.0,
+            "cache_hit_rate": self.counters["cache_hits"] / queries if queries else 0.0,
+            "cache_entries": len(self.cache),
+        }
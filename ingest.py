@@ -0,0 +1,172 @@
+"""Staged ingestion pipeline for NCERT books.
+
+    python ingest.py 9 science --chapters 1 2 3 --workers 4
+
+Concurrent downloads feed a process pool that parses page ranges of every
+chapter in parallel, which feeds batched embedding and upserts into HybridClient.
+Stages are connected by bounded queues, so a slow stage applies backpressure
+instead of buffering whole books in memory.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+import pymupdf
+
+from client import HybridClient
+from logs import setup_logging, stop_logging
+from pdf_cache import PDFCache
+from preprocessing import chunk_blocks, index_pages
+from scraper import download, get_url, probe
+
+DONE = object()
+log = logging.getLogger(__name__)
+
+
+class StageStats:
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.units = 0
+        self.busy = 0.0
+
+    def add(self, units: int, seconds: float):
+        self.items += 1
+        self.units += units
+        self.busy += seconds
+
+    def report(self, wall: float) -> str:
+        rate = self.units / wall if wall else 0.0
+        return f"{self.name:<9} {self.items:>4} chapters  {self.units:>7} {self.unit:<6} {self.busy:7.1f}s busy  {rate:8.1f} {self.unit}/s"
+
+
+def page_count(data: bytes) -> int:
+    return pymupdf.open(stream=data, filetype="pdf").page_count
+
+
+async def download_stage(grade, subject, chapters, queue, stats, concurrency, cache):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(session, chapter):
+        async with semaphore:
+            start = time.perf_counter()
+            pdf = await download(session, get_url(grade, subject, chapter), cache=cache)
+        if pdf:
+            data = pdf.getvalue()
+            stats.add(len(data), time.perf_counter() - start)
+            await queue.put((f"{grade}_{subject}_{chapter}", data))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        if not chapters:
+            chapters = range(1, await probe(session, grade, subject) + 1)
+        await asyncio.gather(*(fetch(session, chapter) for chapter in chapters))
+
+
+async def parse_stage(pool, in_queue, out_queue, stats, pages_per_task, cache):
+    loop = asyncio.get_running_loop()
+    while (item := await in_queue.get()) is not DONE:
+        collection, data = item
+        start = time.perf_counter()
+
+        # Unchanged PDFs reuse the chunks parsed last time
+        sha = hashlib.sha256(data).hexdigest()
+        chunks = cache.get_chunks(sha)
+        pages = 0
+
+        if chunks is None:
+            pages = await loop.run_in_executor(pool, page_count, data)
+            tasks = [loop.run_in_executor(pool, index_pages, data, i, i + pages_per_task) for i in range(0, pages, pages_per_task)]
+            blocks = [block for part in await asyncio.gather(*tasks) for block in part]
+            # Activities and sections run across page ranges, so chunking happens after merging,
+            # lazily: the upload stage embeds chunks as they are produced
+            chunks = cache.write_chunks(sha, chunk_blocks(blocks))
+
+        stats.add(pages, time.perf_counter() - start)
+        await out_queue.put((collection, chunks))
+
+
+async def upload_stage(hclient, queue, stats, batch_size):
+    while (item := await queue.get()) is not DONE:
+        collection, chunks = item
+        start = time.perf_counter()
+
+        # Only new or changed chunks are embedded, in batches on the client's embedder thread
+        diff = await asyncio.to_thread(hclient.sync, collection, chunks, batch_size)
+
+        stats.add(diff["added"], time.perf_counter() - start)
+        log.info("sync %s: %s", collection, diff)
+
+
+async def ingest_book(grade, subject, chapters=None, workers=None, downloads=4, pages_per_task=8, batch_size=64, queue_size=4, hclient=None):
+    cache = PDFCache()
+    workers = workers or os.cpu_count()
+    hclient = hclient or HybridClient()
+
+    parse_queue = asyncio.Queue(maxsize=queue_size)
+    upload_queue = asyncio.Queue(maxsize=queue_size)
+    stats = [StageStats("download", "bytes"), StageStats("parse", "pages"), StageStats("upload", "embedded")]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Enough parsers to keep the pool busy across chapters
+        parsers = [asyncio.create_task(parse_stage(pool, parse_queue, upload_queue, stats[1], pages_per_task, cache)) for _ in range(max(1, workers // 2))]
+
+        async def produce():
+            await download_stage(grade, subject, chapters, parse_queue, stats[0], downloads, cache)
+            for _ in parsers:
+                await parse_queue.put(DONE)
+
+        async def parsed():
+            await asyncio.gather(*parsers)
+            await upload_queue.put(DONE)
+
+        # Every stage is a task gathered here, and the first failure cancels the rest; a failed
+        # stage would otherwise leave its neighbours blocked on a full or empty queue forever
+        tasks = [*parsers, *map(asyncio.create_task, (produce(), parsed(), upload_stage(hclient, upload_queue, stats[2], batch_size)))]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    wall = time.perf_counter() - start
+
+    print(f"\nIngested grade {grade} {subject} in {wall:.1f}s")
+    for stage in stats:
+        print(stage.report(wall))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, chunk, embed and upload NCERT chapters")
+    parser.add_argument("grade", type=int)
+    parser.add_argument("subject")
+    parser.add_argument("--chapters", type=int, nargs="*", help="defaults to every chapter that exists, found by probing")
+    parser.add_argument("--workers", type=int, help="parser processes (default: CPU count)")
+    parser.add_argument("--downloads", type=int, default=4, help="concurrent downloads")
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embed/upsert batch")
+    parser.add_argument("--queue-size", type=int, default=4, help="chapters buffered between stages")
+    args = parser.parse_args()
+
+    setup_logging()
+    asyncio.run(
+        ingest_book(
+            args.grade,
+            args.subject,
+            args.chapters,
+            workers=args.workers,
+            downloads=args.downloads,
+            pages_per_task=args.pages_per_task,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+        )
+    )
+    stop_logging()
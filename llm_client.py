@@ -0,0 +1,222 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+import httpx
+from groq import AsyncGroq, RateLimitError
+
+from config import LLM_MAX_CONCURRENCY, LLM_MODEL, LLM_RATE_LIMIT, LLM_RATE_LIMITS, LLM_TIMEOUT
+from metrics import LLM_TOKENS
+
+
+class RateLimiter:
+    """Sliding one-minute window over requests and tokens for a single model.
+    Callers wait in FIFO order until the window has room instead of failing."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events = deque()  # [timestamp, tokens]
+        self.tokens = 0
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _expire(self, now):
+        while self.events and now - self.events[0][0] >= 60:
+            _, tokens = self.events.popleft()
+            self.tokens -= tokens
+
+    async def acquire(self, tokens: int):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    # A single oversized request is let through on an empty window
+                    if len(self.events) < self.rpm and (self.tokens + tokens <= self.tpm or not self.events):
+                        entry = [now, tokens]
+                        self.events.append(entry)
+                        self.tokens += tokens
+                        return entry
+                    wait = 60 - (now - self.events[0][0])
+
+                await asyncio.sleep(max(wait, 0.05))
+
+    def settle(self, entry, tokens: int):
+        """Replaces the estimated reservation with the actual token usage"""
+        if self.events and entry[0] >= self.events[0][0]:
+            self.tokens += tokens - entry[1]
+            entry[1] = tokens
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class LLMClient:
+    """Long-lived Groq client with pooled HTTP/2 connections, a cap on in-flight
+    requests and per-model rate limiting"""
+
+    def __init__(self, model: str = LLM_MODEL, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.client = None
+        self.semaphore = None
+        self.limiters = {}
+
+        self.counters = {
+            "requests": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "in_flight": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "streams": 0,
+            "ttft_total": 0.0,
+        }
+
+    async def start(self):
+        if self.client is not None:
+            return
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=120,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=5),
+        )
+        # Retries are handled here so that 429s are queued behind the rate limiter
+        self.client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client, max_retries=0)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    def limiter(self, model: str) -> RateLimiter:
+        if model not in self.limiters:
+            self.limiters[model] = RateLimiter(*LLM_RATE_LIMITS.get(model, LLM_RATE_LIMIT))
+        return self.limiters[model]
+
+    async def chat(self, messages: list, model: str = None, max_retries: int = 3, **kwargs) -> str:
+        await self.start()
+        model = model or self.model
+        limiter = self.limiter(model)
+        estimate = self.estimate(messages, kwargs)
+
+        for attempt in range(max_retries + 1):
+            entry = await limiter.acquire(estimate)
+
+            async with self.semaphore:
+                self.counters["in_flight"] += 1
+                start = time.perf_counter()
+                try:
+                    completion = await self.client.chat.completions.create(messages=messages, model=model, **kwargs)
+                except RateLimitError as e:
+                    await self.backoff(e, attempt, max_retries, limiter)
+                    continue
+                except Exception:
+                    self.counters["errors"] += 1
+                    raise
+                finally:
+                    self.counters["in_flight"] -= 1
+
+            self.record(time.perf_counter() - start, completion.usage, model)
+            if completion.usage:
+                limiter.settle(entry, completion.usage.total_tokens)
+            return completion.choices[0].message.content
+
+    async def stream(self, messages: list, model: str = None, max_retries: int = 3, **kwargs):
+        """Yields content deltas as they arrive. Rate limited requests are retried
+        only before the first token, so callers never see a restarted answer."""
+        await self.start()
+        model = model or self.model
+        limiter = self.limiter(model)
+        estimate = self.estimate(messages, kwargs)
+
+        for attempt in range(max_retries + 1):
+            entry = await limiter.acquire(estimate)
+
+            async with self.semaphore:
+                self.counters["in_flight"] += 1
+                start = time.perf_counter()
+                usage = None
+                yielded = False
+                try:
+                    response = await self.client.chat.completions.create(messages=messages, model=model, stream=True, **kwargs)
+
+                    first = True
+                    async for chunk in response:
+                        if first:
+                            self.counters["ttft_total"] += time.perf_counter() - start
+                            self.counters["streams"] += 1
+                            first = False
+
+                        # Groq reports usage on the final chunk
+                        x_groq = getattr(chunk, "x_groq", None)
+                        if x_groq is not None and getattr(x_groq, "usage", None):
+                            usage = x_groq.usage
+
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yielded = True
+                            yield chunk.choices[0].delta.content
+                except RateLimitError as e:
+                    if yielded:
+                        # Retrying would repeat the text the caller already has
+                        self.counters["errors"] += 1
+                        raise
+                    await self.backoff(e, attempt, max_retries, limiter)
+                    continue
+                except Exception:
+                    self.counters["errors"] += 1
+                    raise
+                finally:
+                    self.counters["in_flight"] -= 1
+
+            self.record(time.perf_counter() - start, usage, model)
+            if usage:
+                limiter.settle(entry, usage.total_tokens)
+            return
+
+    async def backoff(self, error: RateLimitError, attempt: int, max_retries: int, limiter: RateLimiter):
+        self.counters["rate_limited"] += 1
+        if attempt == max_retries:
+            self.counters["errors"] += 1
+            raise error
+
+        retry_after = float(error.response.headers.get("retry-after", 2 ** (attempt + 1)))
+        limiter.block(retry_after)
+
+    @staticmethod
+    def estimate(messages: list, kwargs: dict) -> int:
+        """Rough token estimate (4 chars per token) until the response reports actual usage"""
+        return sum(len(m["content"]) for m in messages) // 4 + kwargs.get("max_tokens", 0)
+
+    def record(self, latency: float, usage, model: str):
+        self.counters["requests"] += 1
+        self.counters["latency_total"] += latency
+        self.counters["latency_max"] = max(self.counters["latency_max"], latency)
+        if usage:
+            self.counters["prompt_tokens"] += usage.prompt_tokens
+            self.counters["completion_tokens"] += usage.completion_tokens
+            LLM_TOKENS.observe(usage.prompt_tokens, model=model, kind="prompt")
+            LLM_TOKENS.observe(usage.completion_tokens, model=model, kind="completion")
+
+    def stats(self) -> dict:
+        requests = self.counters["requests"]
+        return self.counters | {
+            "latency_avg": self.counters["latency_total"] / requests if requests else 0.0,
+            "ttft_avg": self.counters["ttft_total"] / self.counters["streams"] if self.counters["streams"] else 0.0,
+            "window_tokens": {model: limiter.tokens for model, limiter in self.limiters.items()},
+        }
+
+
+llm_client = LLMClient()
@@ -0,0 +1,150 @@
+"""Structured logging. Request coroutines only put records on a queue; a listener
+thread formats them, writes them to stderr and keeps the most recent ones in a
+ring buffer that the debug modal reads.
+
+    log = logging.getLogger(__name__)
+    log.info("agent decision", extra=fields(function="retriever", via="router"))
+"""
+
+import logging
+import queue
+import sys
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_BUFFER_SIZE, LOG_LEVEL
+
+# Correlation id of the request being handled, set by RequestIdMiddleware
+request_id = ContextVar("request_id", default="-")
+
+
+def fields(**kwargs) -> dict:
+    """extra= for a structured event: written as key=value pairs, kept as fields in the buffer"""
+    return {"fields": kwargs}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id. Runs on the queue handler, i.e. in the
+    caller's context, before the record crosses to the listener thread."""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class Formatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        pairs = " ".join(f"{key}={value!r}" for key, value in getattr(record, "fields", {}).items())
+        return f"{line} {pairs}" if pairs else line
+
+
+class RingBuffer(logging.Handler):
+    """Keeps the last `size` records as dicts. Only the listener thread appends, and
+    deque appends and copies are atomic, so readers never block it."""
+
+    def __init__(self, size: int = LOG_BUFFER_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=size)
+
+    def emit(self, record):
+        self.records.append(
+            {
+                "time": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S"),
+                "level": record.levelname,
+                "logger": record.name,
+                "request_id": getattr(record, "request_id", "-"),
+                "message": record.getMessage(),
+                **getattr(record, "fields", {}),
+            }
+        )
+
+    def entries(self, level: str = "DEBUG", request: str | None = None) -> list[dict]:
+        minimum = logging.getLevelName(level)
+        return [
+            entry
+            for entry in list(self.records)
+            if logging.getLevelName(entry["level"]) >= minimum and (request is None or entry["request_id"] == request)
+        ]
+
+    def render(self, level: str = "DEBUG") -> str:
+        lines = []
+        for entry in self.entries(level):
+            extra = {key: value for key, value in entry.items() if key not in ("time", "level", "logger", "request_id", "message")}
+            pairs = "".join(f"\n    {key}: {value}" for key, value in extra.items())
+            lines.append(f"[{entry['time']}] {entry['level']} [{entry['request_id']}] {entry['message']}{pairs}")
+        return "\n".join(lines)
+
+    def clear(self):
+        self.records.clear()
+
+
+class RequestIdMiddleware:
+    """ASGI middleware that sets the request id from X-Request-ID (or a new one)
+    and echoes it in the response. Plain ASGI so streaming responses keep it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        value = dict(scope["headers"]).get(b"x-request-id", b"").decode()[:64] or new_request_id()
+        token = request_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+buffer = RingBuffer()
+listener = None
+
+
+def setup_logging(level: str = LOG_LEVEL) -> QueueListener:
+    """Routes the root logger through a queue to stderr and the ring buffer. Idempotent."""
+    global listener
+    if listener is not None:
+        return listener
+
+    records = queue.SimpleQueue()
+    handler = QueueHandler(records)
+    handler.addFilter(RequestIdFilter())
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(Formatter())
+    listener = QueueListener(records, stream, buffer, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    # httpx logs every LLM call at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    listener.start()
+    return listener
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread"""
+    global listener
+    if listener is not None:
+        logging.getLogger().handlers = [h for h in logging.getLogger().handlers if not isinstance(h, QueueHandler)]
+        listener.stop()
+        listener = None
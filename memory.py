@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from config import MEMORY_IDLE_TTL, MEMORY_MAX_SESSIONS, MEMORY_SUMMARY_WORDS, MEMORY_TOPIC_THRESHOLD, MEMORY_TURNS
+from llm_client import llm_client
+from logs import fields
+from metrics import Span
+from prompts import SUMMARY_PROMPT
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Session:
+    id: str
+    turns: list = field(default_factory=list)  # (user, assistant) pairs kept verbatim, oldest first
+    pending: list = field(default_factory=list)  # older turns not yet folded into the summary
+    summary: str = ""
+    summarizing: bool = False
+    # Candidates of the last retrieval, reused while follow-ups stay on its topic
+    collection: str | None = None
+    topic: np.ndarray | None = None
+    hits: list = field(default_factory=list)
+    accessed: float = field(default_factory=time.monotonic)
+
+    @property
+    def has_context(self) -> bool:
+        return bool(self.turns or self.pending or self.summary)
+
+
+class SessionMemory:
+    """Per-session conversation memory, bounded in sessions and in prompt size.
+
+    The last `max_turns` turns are kept verbatim. Older turns are folded into a
+    rolling summary by a background LLM call, so requests never wait for it.
+    Idle sessions expire after `ttl` seconds, and the least recently used are
+    evicted beyond `max_sessions`."""
+
+    def __init__(
+        self,
+        max_sessions: int = MEMORY_MAX_SESSIONS,
+        ttl: float = MEMORY_IDLE_TTL,
+        max_turns: int = MEMORY_TURNS,
+        summary_words: int = MEMORY_SUMMARY_WORDS,
+        topic_threshold: float = MEMORY_TOPIC_THRESHOLD,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.summary_words = summary_words
+        self.topic_threshold = topic_threshold
+        self.sessions = OrderedDict()  # id -> Session, in LRU order
+        self.tasks = set()
+        self.counters = {"turns": 0, "summaries": 0, "summary_errors": 0, "evictions": 0, "hits_reused": 0, "hits_searched": 0}
+
+    def get(self, session_id: str | None) -> Session | None:
+        if not session_id:
+            return None
+        now = time.monotonic()
+        session = self.sessions.pop(session_id, None)
+        if session is not None and now - session.accessed >= self.ttl:
+            session = None
+            self.counters["evictions"] += 1
+
+        # Idle sessions first, then the least recently used beyond the limit
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.accessed < self.ttl and len(self.sessions) < self.max_sessions:
+                break
+            self.sessions.popitem(last=False)
+            self.counters["evictions"] += 1
+
+        session = session or Session(session_id)
+        session.accessed = now
+        self.sessions[session_id] = session
+        return session
+
+    def render(self, session: Session | None) -> str:
+        """The conversation so far, as prompt text"""
+        if session is None or not session.has_context:
+            return ""
+        parts = [f"Summary of earlier turns: {session.summary}"] if session.summary else []
+        parts += [f"User: {user}\nAssistant: {assistant}" for user, assistant in session.pending + session.turns]
+        return "\n\n".join(parts)
+
+    def add_turn(self, session: Session | None, user: str, assistant: str):
+        if session is None:
+            return
+        self.counters["turns"] += 1
+        session.turns.append((user, assistant))
+        if len(session.turns) > self.max_turns:
+            session.pending += session.turns[: -self.max_turns]
+            session.turns = session.turns[-self.max_turns :]
+            if not session.summarizing:
+                session.summarizing = True
+                task = asyncio.create_task(self.summarize(session))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    def record(self, session: Session | None, user: str, response):
+        """Adds a completed response as a turn and returns it"""
+        self.add_turn(session, user, reply_text(response))
+        return response
+
+    async def record_stream(self, session: Session | None, user: str, events):
+        """Passes a streamed response through, adding it as a turn once it completes"""
+        reply = []
+        async for event in events:
+            reply.append(reply_text(event))
+            yield event
+        self.add_turn(session, user, "".join(reply))
+
+    async def summarize(self, session: Session):
+        """Folds pending turns into the summary until none are left"""
+        try:
+            while session.pending:
+                turns = session.pending[:]
+                prompt = SUMMARY_PROMPT.format(
+                    self.summary_words,
+                    session.summary or "(none)",
+                    "\n\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns),
+                )
+                with Span("summarize"):
+                    summary = await llm_client.chat(
+                        [{"role": "user", "content": prompt}], temperature=0.2, max_tokens=self.summary_words * 2
+                    )
+                session.summary = summary.strip()
+                session.pending = session.pending[len(turns) :]
+                self.counters["summaries"] += 1
+        except Exception:
+            # Pending turns stay verbatim and are retried with the next turn, but are capped
+            self.counters["summary_errors"] += 1
+            session.pending = session.pending[-self.max_turns :]
+            log.exception("summary failed", extra=fields(session=session.id))
+        finally:
+            session.summarizing = False
+
+    def reusable_hits(self, session: Session | None, collection: str, vector) -> list | None:
+        """Candidates of the session's last retrieval, when the query is still on its topic"""
+        if session is None or not session.hits or session.collection != collection:
+            return None
+        vector = np.asarray(vector)
+        similarity = float(vector @ session.topic / (np.linalg.norm(vector) * np.linalg.norm(session.topic) + 1e-9))
+        if similarity < self.topic_threshold:
+            return None
+        self.counters["hits_reused"] += 1
+        return session.hits
+
+    def remember_hits(self, session: Session | None, collection: str, vector, hits: list):
+        # Reused hits keep the topic of the query that retrieved them
+        if session is None or hits is session.hits:
+            return
+        self.counters["hits_searched"] += 1
+        session.collection, session.topic, session.hits = collection, np.asarray(vector), hits
+
+    def stats(self) -> dict:
+        return self.counters | {"sessions": len(self.sessions), "summarizing": len(self.tasks)}
+
+
+def reply_text(response) -> str:
+    """What is remembered of a response: its text, a marker for audio, nothing for sources"""
+    if isinstance(response, str):
+        return response
+    if "text" in response:
+        return response["text"]
+    if "audio" in response or "audio_url" in response:
+        return "(replied with audio)"
+    return ""
+
+
+memory = SessionMemory()
@@ -0,0 +1,199 @@
+"""Latency, token and payload-size histograms for the agent pipeline, exposed in
+the Prometheus text format at /metrics.
+
+    with Span("translator") as span:
+        ...
+        span.size("out", len(audio))
+
+Spans also add their duration to the current request's Server-Timing breakdown
+when SERVER_TIMING is enabled (see TimingMiddleware).
+"""
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import aclosing
+from contextvars import ContextVar
+
+from config import SERVER_TIMING
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# stage -> [seconds, calls] for the request being handled, set by TimingMiddleware
+timings = ContextVar("timings", default=None)
+
+
+def label_text(names, values, le=None):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in [*zip(self.buckets, values), ("+Inf", values[-1])]:
+                lines.append(f"{self.name}_bucket{label_text(self.labels, key, bound)} {count}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{label_text(self.labels, key)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for key, value in sorted(series.items()):
+            lines.append(f"{self.name}{label_text(self.labels, key)} {value}")
+        return lines
+
+
+METRICS = []
+
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Time spent per pipeline stage", ("stage",))
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Pipeline stages that raised", ("stage",))
+STAGE_BYTES = Histogram("rag_stage_payload_bytes", "Payload sizes sent to and received from each stage", ("stage", "direction"), SIZE_BUCKETS)
+LLM_TOKENS = Histogram("rag_llm_tokens", "Tokens per LLM call", ("model", "kind"), TOKEN_BUCKETS)
+REQUEST_SECONDS = Histogram("rag_http_request_duration_seconds", "Time to complete API requests, including streamed bodies", ("path", "status"))
+SPECULATIONS = Counter("rag_speculations_total", "Speculative retrievals by whether the router kept them", ("level", "outcome"))
+SPECULATION_HEAD_START = Histogram("rag_speculation_head_start_seconds", "Time kept speculative work ran before the router decided", ("level",))
+SPECULATION_WASTED = Histogram("rag_speculation_wasted_seconds", "Time discarded speculative work ran before it was cancelled", ("level",))
+
+
+class Span:
+    """Times a block as one pipeline stage"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        # Cancellation and closed generators are not failures
+        if isinstance(error, Exception):
+            STAGE_ERRORS.inc(stage=self.stage)
+
+        breakdown = timings.get()
+        if breakdown is not None:
+            total = breakdown.setdefault(self.stage, [0.0, 0])
+            total[0] += elapsed
+            total[1] += 1
+
+    def size(self, direction: str, value: int):
+        STAGE_BYTES.observe(value, stage=self.stage, direction=direction)
+
+
+def traced(stage: str):
+    """Decorator form of Span, for coroutine functions and async generators.
+    Generators are timed until they are exhausted or closed."""
+
+    def decorator(function):
+        if inspect.isasyncgenfunction(function):
+
+            @functools.wraps(function)
+            async def generator(*args, **kwargs):
+                with Span(stage):
+                    async with aclosing(function(*args, **kwargs)) as items:
+                        async for item in items:
+                            yield item
+
+            return generator
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with Span(stage):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def server_timing(breakdown: dict, total: float) -> str:
+    entries = [f'{stage};dur={seconds * 1000:.1f};desc="{calls}x"' for stage, (seconds, calls) in breakdown.items()]
+    return ", ".join([*entries, f"total;dur={total * 1000:.1f}"])
+
+
+class TimingMiddleware:
+    """Records API request durations and, with SERVER_TIMING, sends the request's
+    per-stage breakdown as a Server-Timing header. Headers go out before a
+    streamed body, so streaming responses only include the stages before it."""
+
+    def __init__(self, app, enabled: bool = SERVER_TIMING):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        breakdown = {}
+        token = timings.set(breakdown)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.enabled:
+                    header = server_timing(breakdown, time.perf_counter() - start)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timings.reset(token)
+            # Labelled by route template, so /audio/{name} is one series; unmatched paths are skipped
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                REQUEST_SECONDS.observe(time.perf_counter() - start, path=route.path, status=status)
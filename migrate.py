@@ -0,0 +1,61 @@
+"""Copies per-chapter collections (9_science_1, 9_science_2, ...) into one collection
+per book (9_science) for COLLECTION_LAYOUT=subject.
+
+    python migrate.py [--grade 9] [--subject science] [--delete]
+
+Points keep their ids, vectors and payloads, plus the grade, subject and chapter
+fields that filtered search uses, so chapter manifests stay valid and the copy can
+be re-run. A chapter is only deleted (--delete) once the book holds all its points.
+Switch COLLECTION_LAYOUT after migrating; the registry is unaffected, as chapters
+keep their names.
+"""
+
+import argparse
+from collections import defaultdict
+
+from client import HybridClient
+from registry import parse_collection
+
+
+def migrate(hclient: HybridClient, grade: str = None, subject: str = None, delete: bool = False, batch_size: int = 256) -> dict:
+    backend = hclient.backend
+    books = defaultdict(list)
+    for collection in backend.collections():
+        parsed = parse_collection(collection)
+        if parsed and grade in (None, parsed[0]) and subject in (None, parsed[1]):
+            books[parsed[:2]].append(collection)
+
+    copied = {}
+    for (book_grade, book_subject), collections in sorted(books.items()):
+        book = f"{book_grade}_{book_subject}"
+        if not backend.exists(book):
+            backend.create(book, hclient.DENSE_DIM)
+        for collection in sorted(collections, key=lambda name: int(parse_collection(name)[2])):
+            chapter = int(parse_collection(collection)[2])
+            location = {"grade": int(book_grade), "subject": book_subject, "chapter": chapter}
+            count = 0
+            # One index rewrite per chapter with the local backend, instead of one per batch
+            with backend.writes(book):
+                for ids, dense, sparse, payloads in backend.points(collection, batch_size):
+                    backend.upsert(book, ids, dense, sparse, [{**payload, **location} for payload in payloads])
+                    count += len(ids)
+
+            stored = backend.count(book, {"chapter": chapter})
+            copied[collection] = count
+            print(f"--- {collection} -> {book}: {count} points, {stored} in book")
+            if delete and stored >= count:
+                backend.delete_collection(collection)
+            elif delete:
+                print(f"    kept {collection}: the book is missing {count - stored} of its points")
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy per-chapter collections into per-book collections")
+    parser.add_argument("--grade", help="only this grade's books")
+    parser.add_argument("--subject", help="only this subject's books")
+    parser.add_argument("--delete", action="store_true", help="delete each chapter collection once copied")
+    parser.add_argument("--batch-size", type=int, default=256, help="points per read/upsert")
+    args = parser.parse_args()
+
+    migrate(HybridClient(), args.grade, args.subject and args.subject.lower(), args.delete, args.batch_size)
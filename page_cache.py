@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import PAGE_CACHE_DIR, PAGE_CACHE_MAX_PAGES, PAGE_CACHE_TTL
+
+
+class PageCache:
+    """Persistent cache of extracted web pages, keyed by URL.
+
+    Stores the page's main-content blocks, not its HTML, along with the ETag
+    and Last-Modified validators. Pages younger than `ttl` are served without a
+    request; older ones are revalidated with a conditional GET. Pages are
+    evicted least recently used first. Methods do blocking SQLite calls; async
+    callers run them in a thread."""
+
+    def __init__(self, root: str = PAGE_CACHE_DIR, ttl: float = PAGE_CACHE_TTL, max_pages: int = PAGE_CACHE_MAX_PAGES):
+        self.root = root
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self._db = None
+        self.count = 0  # rows, kept in memory instead of counted on every put
+        self.counters = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.root, "pages.db"), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, blocks TEXT, etag TEXT, last_modified TEXT, fetched REAL, accessed REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+            (self.count,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+        return self._db
+
+    def get(self, url: str) -> dict | None:
+        """{"blocks", "etag", "last_modified", "fresh"} for a cached page"""
+        with self.lock:
+            row = self.db.execute("SELECT blocks, etag, last_modified, fetched FROM pages WHERE url = ?", (url,)).fetchone()
+            if row:
+                self.db.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        blocks, etag, last_modified, fetched = row
+        return {"blocks": json.loads(blocks), "etag": etag, "last_modified": last_modified, "fresh": time.time() - fetched < self.ttl}
+
+    def validators(self, page: dict | None) -> dict:
+        """Conditional request headers for a stale cached page"""
+        headers = {}
+        if page and page["etag"]:
+            headers["If-None-Match"] = page["etag"]
+        if page and page["last_modified"]:
+            headers["If-Modified-Since"] = page["last_modified"]
+        return headers
+
+    def hit(self, url: str, revalidated: bool = False):
+        self.counters["revalidated" if revalidated else "hits"] += 1
+        if revalidated:
+            with self.lock:
+                self.db.execute("UPDATE pages SET fetched = ? WHERE url = ?", (time.time(), url))
+
+    def put(self, url: str, blocks: list[str], etag: str = None, last_modified: str = None):
+        now = time.time()
+        with self.lock:
+            known = self.db.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", (url, json.dumps(blocks), etag, last_modified, now, now))
+            self.count += not known
+            if self.count > self.max_pages:
+                self.db.execute("DELETE FROM pages WHERE url IN (SELECT url FROM pages ORDER BY accessed LIMIT ?)", (self.count - self.max_pages,))
+                self.counters["evictions"] += self.count - self.max_pages
+                self.count = self.max_pages
+
+    def stats(self) -> dict:
+        self.db  # opening the database loads the row count
+        lookups = self.counters["hits"] + self.counters["revalidated"] + self.counters["misses"]
+        served = self.counters["hits"] + self.counters["revalidated"]
+        return self.counters | {"hit_rate": served / lookups if lookups else 0.0, "pages": self.count}
+
+
+page_cache = PageCache()
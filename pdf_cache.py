@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import uuid
+
+from config import CHUNKER, PDF_CACHE_DIR
+
+# Bump when chunking changes so cached chunks from older parsers are ignored
+CHUNKER_VERSION = 3
+
+
+class PDFCache:
+    """On-disk cache of downloaded PDFs and their parsed chunks.
+
+    Each URL has a small metadata file with its ETag, Last-Modified and content
+    hash; the PDF bytes and chunks are stored by content hash, so a chapter that
+    is re-served unchanged is neither downloaded nor parsed again."""
+
+    def __init__(self, root: str = PDF_CACHE_DIR):
+        self.root = root
+        for directory in ("urls", "pdfs", "chunks"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def _path(self, directory: str, name: str) -> str:
+        return os.path.join(self.root, directory, name)
+
+    def meta(self, url: str) -> dict | None:
+        path = self._path("urls", hashlib.sha256(url.encode()).hexdigest() + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        return meta if os.path.exists(self._path("pdfs", meta["sha256"] + ".pdf")) else None
+
+    def validators(self, url: str) -> dict:
+        """Conditional request headers for a cached URL"""
+        meta = self.meta(url)
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def get(self, url: str) -> bytes | None:
+        meta = self.meta(url)
+        if meta is None:
+            return None
+        with open(self._path("pdfs", meta["sha256"] + ".pdf"), "rb") as f:
+            return f.read()
+
+    def put(self, url: str, data: bytes, etag: str = None, last_modified: str = None) -> str:
+        sha = hashlib.sha256(data).hexdigest()
+        write_atomic(self._path("pdfs", sha + ".pdf"), data)
+
+        meta = {"url": url, "sha256": sha, "size": len(data), "etag": etag, "last_modified": last_modified}
+        write_atomic(self._path("urls", hashlib.sha256(url.encode()).hexdigest() + ".json"), json.dumps(meta).encode())
+        return sha
+
+    def get_chunks(self, sha: str):
+        """Cached chunks, read lazily, or None"""
+        path = self._path("chunks", f"{sha}.{CHUNKER}.v{CHUNKER_VERSION}.jsonl")
+        if not os.path.exists(path):
+            return None
+        return read_lines(path)
+
+    def write_chunks(self, sha: str, chunks):
+        """Passes chunks through, writing each to the cache as it goes by. The
+        entry only appears once the last chunk has been written."""
+        path = self._path("chunks", f"{sha}.{CHUNKER}.v{CHUNKER_VERSION}.jsonl")
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                for chunk in chunks:
+                    f.write(json.dumps(chunk) + "\n")
+                    yield chunk
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def read_lines(path: str):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
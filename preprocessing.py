@@ -1,38 +1,60 @@
+import logging
 import re
 from collections import OrderedDict, defaultdict
+from itertools import chain, islice
 
+import numpy as np
 import pymupdf
 
+from config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP, CHUNKER
+from logs import fields
+from tokens import count_tokens
 
-def sort_text(chunks):
-    x_threshold = 300
-    left_column = []
-    right_column = []
+log = logging.getLogger(__name__)
+
+
+# Text extraction without decoding images, which get_chunks discards anyway
+TEXT_FLAGS = pymupdf.TEXTFLAGS_DICT & ~pymupdf.TEXT_PRESERVE_IMAGES
+
+
+def column_edge(x0, width):
+    """Left edge of a right-hand column, or None for single-column pages.
+
+    Column edges are x positions shared by several blocks; a second edge must
+    start at least a quarter of the page to the right of the first. Blocks
+    starting left of it (e.g. centred headings) stay in the left column."""
+    if len(x0) < 2:
+        return None
+    bins, counts = np.unique(np.round(np.asarray(x0) / 10), return_counts=True)
+    edges = bins[counts >= 2] * 10
+    if len(edges) < 2:
+        return None
+    right = edges[edges - edges[0] >= width / 4]
+    return float(right[0]) - 10 if len(right) else None
 
-    for chunk in chunks:
-        if chunk["coordinates"][0] < x_threshold:
-            left_column.append(chunk)
-        else:
-            right_column.append(chunk)
 
-    # Sort the chunks within each column based on the y-coordinate
-    left_column = sorted(left_column, key=lambda item: item["coordinates"][1])
-    right_column = sorted(right_column, key=lambda item: item["coordinates"][1])
+def sort_text(chunks, width=600):
+    x0 = np.array([chunk["coordinates"][0] for chunk in chunks])
+    y0 = np.array([chunk["coordinates"][1] for chunk in chunks])
 
-    sorted_text = left_column + right_column
-    return sorted_text
+    edge = column_edge(x0, width)
+    column = x0 >= edge if edge is not None else np.zeros(len(chunks), dtype=bool)
 
+    # Left column first, each column top to bottom
+    order = np.lexsort((y0, column))
+    return [chunks[i] for i in order]
 
-def majority_element(spans, param):
-    char_count = defaultdict(int)
 
-    for span in spans:
-        span_text = span["text"]
-        span_param = span[param]  # Get the color or size for this span
-        char_count[span_param] += len(span_text)  # Count characters
+def block_majority(blocks, values, weights):
+    """Per block, the value with the highest total weight; ties go to the value seen first"""
+    codes, inverse = np.unique(values, return_inverse=True)
+    pairs, first, pair_inverse = np.unique(blocks * len(codes) + inverse, return_index=True, return_inverse=True)
+    totals = np.bincount(pair_inverse, weights=weights)
+    pair_blocks = pairs // len(codes)
 
-    # Return the parameter value with the highest character count
-    return max(char_count, key=char_count.get, default=None)
+    order = np.lexsort((first, -totals, pair_blocks))
+    winners = order[np.r_[True, pair_blocks[order][1:] != pair_blocks[order][:-1]]]
+    return dict(zip(pair_blocks[winners].tolist(), codes[pairs[winners] % len(codes)].tolist()))
 
 
 def clean_text(text):
@@ -44,51 +66,81 @@ def clean_text(text):
     return cleaned_text
 
 
-def get_chunks(doc):
-    allchunks = []
+def span_table(page):
+    """Flattens the page's text spans into per-span arrays"""
+    blocks, texts, sizes, colors, bboxes = [], [], [], [], []
+    for block in page.get_text("dict", flags=TEXT_FLAGS)["blocks"]:
+        if "lines" not in block:
+            continue
+        bboxes.append(block["bbox"])
+        for line in block["lines"]:
+            for span in line["spans"]:
+                blocks.append(len(bboxes) - 1)
+                texts.append(span["text"])
+                sizes.append(span["size"])
+                colors.append(span["color"])
 
+    return {
+        "block": np.array(blocks, dtype=np.int64),
+        "text": texts,
+        "size": np.array(sizes, dtype=np.float64),
+        "color": np.array(colors, dtype=np.int64),
+        "chars": np.array([len(text) for text in texts], dtype=np.int64),
+        "bbox": np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+    }
+
+
+def get_chunks(doc, pages=None):
+    return list(iter_blocks(doc, pages))
+
+
+def iter_blocks(doc, pages=None):
+    """Yields text blocks page by page, in reading order"""
     # Page Iteration
-    for page_num in range(doc.page_count):
-        chunks = []
-        page = doc[page_num]
-
-        # Filter images (not needed)
-        blocks = [i for i in page.get_text("dict")["blocks"] if "image" not in i]
-
-        # Block Iteration
-        for block in blocks:
-            text = ""
-            spans = []
-
-            # Line iteration
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    # Only include text with a size greater than 9
-                    if span["size"] > 9:
-                        span_text = span["text"]
-                        text += span_text + " "
-                        spans.append(span)  # Store the span for majority calculation
-
-            # Filter empty strings
-            if text.strip():
-                chunks.append(
-                    {
-                        "text": clean_text(text.strip()),
-                        "page": page_num,
-                        "coordinates": [round(block["bbox"][0], 1), round(block["bbox"][1], 1)],
-                        "color": majority_element(spans, "color"),
-                        "size": majority_element(spans, "size"),
-                    }
-                )
-
-        # Sort text according to column order
-        allchunks.extend(sort_text(chunks))
-    return allchunks
+    for page_num in pages or range(doc.page_count):
+        yield from page_chunks(doc[page_num], page_num)
+
+
+def page_chunks(page, page_num):
+    spans = span_table(page)
+
+    # Only include text with a size greater than 9
+    keep = np.flatnonzero(spans["size"] > 9)
+    if not len(keep):
+        return []
+
+    blocks = spans["block"][keep]
+    colors = block_majority(blocks, spans["color"][keep], spans["chars"][keep])
+    sizes = block_majority(blocks, spans["size"][keep], spans["chars"][keep])
+
+    # Spans are in block order, so each block's text is a contiguous run
+    starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]])
+    ends = np.r_[starts[1:], len(blocks)]
+
+    chunks = []
+    for start, end in zip(starts, ends):
+        text = " ".join(spans["text"][i] for i in keep[start:end]).strip()
+        # Filter empty strings
+        if text:
+            block = int(blocks[start])
+            x0, y0 = spans["bbox"][block][:2]
+            chunks.append(
+                {
+                    "text": clean_text(text),
+                    "page": page_num,
+                    "coordinates": [round(float(x0), 1), round(float(y0), 1)],
+                    "color": colors[block],
+                    "size": sizes[block],
+                }
+            )
+
+    # Sort text according to column order
+    return sort_text(chunks, page.rect.width)
 
 
 def process_activities(chunks):
     """Groups lines of 'Activity' together"""
-    # activities = []
+    grouped = []
     i = 0
     while i < len(chunks):
         chunk = chunks[i]
@@ -98,18 +150,158 @@ def process_activities(chunks):
 
             j = i + 1
             while j < len(chunks) and chunks[j]["size"] == activity_size:
-                activity["text"] += "\n" + chunks[j]["text"]
                 j += 1
 
-            # Replace the range of chunks with the single activity chunk
-            chunks[i:j] = [activity]
-
-            # activities.append(activity)
-            i += 1
+            # Single join and append instead of string concatenation and list splicing
+            activity["text"] = "\n".join(c["text"] for c in chunks[i:j])
+            grouped.append(activity)
+            i = j
         else:
+            grouped.append(chunk)
             i += 1
 
-    return chunks
+    return grouped
+
+
+def block_kind(block, body_size, body_color):
+    if block["text"].startswith("Activity"):
+        return "activity"
+    if block["size"] > body_size + 1 and len(block["text"]) < 120:
+        return "heading"
+    if block["color"] != body_color:
+        return "box"
+    return "paragraph"
+
+
+def body_style(blocks):
+    """Character-weighted most common size and color"""
+    sizes, colors = defaultdict(int), defaultdict(int)
+    for block in blocks:
+        sizes[block["size"]] += len(block["text"])
+        colors[block["color"]] += len(block["text"])
+    return max(sizes, key=sizes.get, default=0), max(colors, key=colors.get, default=0)
+
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_block(text, max_tokens):
+    """Pieces of text of at most max_tokens each, split on sentence boundaries,
+    or between words for sentences that are longer than max_tokens on their own"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current = [], []
+    for sentence in SENTENCE_PATTERN.split(text):
+        if count_tokens(" ".join(current + [sentence])) <= max_tokens:
+            current.append(sentence)
+            continue
+        if current:
+            pieces.append(" ".join(current))
+        current = [sentence]
+        if count_tokens(sentence) > max_tokens:
+            # Whole windows of words; the last one stays open for the next sentence
+            words = sentence.split()
+            step = max(1, max_tokens * 3 // 4)
+            while step > 1 and count_tokens(" ".join(words[:step])) > max_tokens:
+                step -= 1
+            pieces += [" ".join(words[i : i + step]) for i in range(0, len(words), step)]
+            current = [pieces.pop()]
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def structural_chunks(blocks, max_tokens=CHUNK_MAX_TOKENS, overlap=CHUNK_OVERLAP, lookahead=50):
+    """Single pass over text blocks (e.g. iter_blocks) that yields chunks of at
+    most `max_tokens`. Headings start a new section and are prepended to its
+    chunks, activities and boxed content are kept apart from running text, and
+    consecutive chunks of one unit share `overlap` tokens. Blocks too long for
+    one chunk are split on sentences. Only the first `lookahead` blocks are
+    buffered, to find the body style."""
+    blocks = iter(blocks)
+    head = list(islice(blocks, lookahead))
+    body_size, body_color = body_style(head)
+
+    section, section_size = "", None
+    current = None  # open chunk: {"kind", "parts", ...first block fields}
+    activity_size = None
+
+    def render(parts):
+        return "\n".join([section, *parts] if section else parts)
+
+    def flush():
+        if current and current["parts"]:
+            return {key: current[key] for key in ("page", "coordinates", "color", "size")} | {
+                "text": render(current["parts"]),
+                "section": section,
+                "section_size": section_size,
+                "kind": current["kind"],
+            }
+
+    def start(kind, block, parts=None):
+        return {
+            "kind": kind,
+            "parts": parts or [],
+            "page": block["page"],
+            "coordinates": block["coordinates"],
+            "color": block["color"],
+            "size": block["size"],
+        }
+
+    for block in chain(head, blocks):
+        kind = block_kind(block, body_size, body_color)
+
+        # An activity continues for as long as blocks keep the size of its first line
+        if activity_size is not None:
+            if block["size"] == activity_size and kind != "heading":
+                kind = "activity"
+            else:
+                activity_size = None
+        elif current and current["kind"] == "activity" and kind != "heading":
+            activity_size = block["size"]
+            kind = "activity"
+
+        if kind == "heading":
+            if chunk := flush():
+                yield chunk
+            section, section_size = block["text"], block["size"]
+            current = None
+            continue
+
+        if current is None or current["kind"] != kind or (kind == "activity" and block["text"].startswith("Activity")):
+            if chunk := flush():
+                yield chunk
+            current = start(kind, block)
+
+        # The heading goes into every chunk of its section, so it counts against the budget
+        budget = max(1, max_tokens - count_tokens(section) - 1) if section else max_tokens
+        for piece in split_block(block["text"], budget):
+            if current["parts"] and count_tokens(render(current["parts"] + [piece])) > max_tokens:
+                yield flush()
+                # Carry the tail of the previous chunk over for context, as much of it as fits
+                tail = " ".join(current["parts"]).split()[-(overlap * 3 // 4) :] if overlap else []
+                while tail and count_tokens(render([" ".join(tail), piece])) > max_tokens:
+                    tail = tail[1:]
+                current = start(kind, block, [" ".join(tail)] if tail else None)
+            current["parts"].append(piece)
+
+    if chunk := flush():
+        yield chunk
+
+
+def chunk_blocks(blocks, strategy=CHUNKER):
+    """Turns text blocks into the chunks that get indexed. The structural chunker
+    yields them lazily, so they can be embedded while later pages are chunked."""
+    if strategy == "structural":
+        return structural_chunks(blocks)
+    return process_activities(list(blocks))
+
+
+def index_pages(data: bytes, start: int, stop: int):
+    """Chunks for pages [start, stop) of an in-memory PDF. Runs in worker processes,
+    so it takes plain bytes and re-opens the document."""
+    doc = pymupdf.open(stream=data, filetype="pdf")
+    return get_chunks(doc, range(start, min(stop, doc.page_count)))
 
 
 def index_pdf(path, buffer=False):
@@ -117,7 +309,6 @@ def index_pdf(path, buffer=False):
         doc = pymupdf.open(stream=path, filetype="pdf")
     else:
         doc = pymupdf.open(path)
-    chunks = get_chunks(doc)
-    chunks = process_activities(chunks)
-    print("--- pdf indexed")
+    chunks = list(chunk_blocks(iter_blocks(doc)))
+    log.debug("pdf indexed", extra=fields(chunks=len(chunks)))
     return chunks
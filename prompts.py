@@ -39,6 +39,7 @@ Key points:
 1. If the retrieved information is insufficient, supplement with your knowledge but clearly indicate this.
 2. If you're unsure or the information is contradictory, express this uncertainty.
 3. Encourage critical thinking and further exploration of the topic when appropriate.
+4. Each retrieved passage starts with its textbook page, e.g. [Page 3], or its chapter and page when passages come from several chapters, e.g. [Chapter 2, Page 3]. Cite the pages you use, e.g. (p. 3) or (ch. 2, p. 3).
 """
 
 RAG_USER_PROMPT = """Based on the following retrieved information and the user's query, provide a helpful and educational response:
@@ -67,3 +68,26 @@ Retrieved Information:
 
 User Query: {}
 """
+
+
+CHAPTER_PROMPT = """
+The user is currently studying chapter {}: "{}".
+"""
+
+
+CONVERSATION_PROMPT = """Conversation so far, for context. Resolve references like "it" or "that" from it, but answer only the current query.
+{}
+
+"""
+
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a student and a tutoring assistant with the new turns below.
+Keep the topics discussed, the key facts the student was given, and anything the student asked for or said about themselves. Drop greetings and repetition.
+Reply with the updated summary only, in at most {} words.
+
+Current summary:
+{}
+
+New turns:
+{}
+"""
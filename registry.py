@@ -0,0 +1,202 @@
+"""Registry of indexed chapters, kept in memory so that requests never go to the
+vector store for metadata.
+
+    python registry.py    # rebuild registry.json from the vector store
+
+HybridClient.sync records each chapter it indexes (title, chunk count) in
+REGISTRY_PATH. The API loads the file at startup and reloads it when an
+ingestion run in another process changes it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+from config import REGISTRY_PATH, REGISTRY_REFRESH_INTERVAL
+from prompts import AGENT_PROMPT, CHAPTER_PROMPT, RAG_SYS_PROMPT
+
+COLLECTION_PATTERN = re.compile(r"^(\d+)_([a-z]+)_(\d+)$")
+# Chapter "9_science_1", chapter range "9_science_3-5" or whole book "9_science"
+SCOPE_PATTERN = re.compile(r"^(\d+)_([a-z]+)(?:_(\d+)(?:-(\d+))?)?$")
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Chapter:
+    collection: str
+    grade: str
+    subject: str
+    chapter: str
+    title: str | None = None
+    chunks: int = 0
+    updated: float = 0.0
+    # Rendered once per chapter instead of per request
+    agent_prompt: str = field(default="", repr=False)
+    rag_prompt: str = field(default="", repr=False)
+
+    def __post_init__(self):
+        context = CHAPTER_PROMPT.format(self.chapter, self.title) if self.title else ""
+        self.agent_prompt = AGENT_PROMPT.format(self.grade, self.subject) + context
+        self.rag_prompt = RAG_SYS_PROMPT.format(self.subject, self.grade) + context
+
+    def to_json(self) -> dict:
+        return {"grade": self.grade, "subject": self.subject, "chapter": self.chapter, "title": self.title, "chunks": self.chunks, "updated": self.updated}
+
+
+class Registry:
+    def __init__(self, path: str = REGISTRY_PATH):
+        self.path = path
+        self.chapters: dict[str, Chapter] = {}
+        self.mtime = None
+        # Called by watch with the name of each chapter another process (re)indexed, e.g. to invalidate caches
+        self.on_change = []
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        mtime = os.path.getmtime(self.path)
+        with open(self.path) as f:
+            data = json.load(f)
+        self.chapters = {collection: Chapter(collection, **info) for collection, info in data.items()}
+        self.mtime = mtime
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({collection: chapter.to_json() for collection, chapter in sorted(self.chapters.items())}, f, indent=1)
+        os.replace(tmp, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def record(self, collection: str, title: str | None, chunks: int):
+        """Called after a collection is (re)indexed"""
+        if not (parsed := parse_collection(collection)):
+            return
+        self.load()  # pick up chapters recorded by other processes
+        previous = self.chapters.get(collection)
+        self.chapters[collection] = Chapter(collection, *parsed, title=title or (previous and previous.title), chunks=chunks, updated=time.time())
+        self.save()
+
+    def rebuild(self, client):
+        """Registers every collection in the vector store; titles come from the
+        existing registry, as they are only known at ingestion time"""
+        self.load()
+        counts = {}
+        for collection in client.backend.collections():
+            if parse_collection(collection):
+                counts[collection] = client.backend.count(collection)
+            elif scope := parse_scope(collection):
+                # A book collection (COLLECTION_LAYOUT=subject): its chapters are payload values
+                for chapter, count in client.backend.facet(collection, "chapter").items():
+                    if chapter is not None:
+                        counts[f"{collection}_{chapter}"] = count
+
+        for collection, count in counts.items():
+            previous = self.chapters.get(collection)
+            title = previous.title if previous else None
+            self.chapters[collection] = Chapter(collection, *parse_collection(collection), title=title, chunks=count, updated=time.time())
+        self.save()
+
+    def get(self, collection: str) -> Chapter:
+        """Chapter metadata, falling back to what the collection name says for unregistered
+        collections. The fallback is not stored, so requested names never grow the registry."""
+        if collection in self.chapters:
+            return self.chapters[collection]
+        # Chapter ranges and whole books (see parse_scope) have no title
+        grade, subject, *chapter = collection.split("_", 2)
+        return Chapter(collection, grade, subject, chapter[0] if chapter else "all")
+
+    def indexed(self) -> list[Chapter]:
+        return [chapter for chapter in self.chapters.values() if chapter.chunks]
+
+    def grades(self) -> list[str]:
+        return sorted({chapter.grade for chapter in self.indexed()}, key=int)
+
+    def subjects(self, grade: str) -> list[str]:
+        return sorted({chapter.subject for chapter in self.indexed() if chapter.grade == grade})
+
+    def chapter_choices(self, grade: str, subject: str) -> list[tuple[str, str]]:
+        """(label, chapter number) pairs, labelled with titles where known"""
+        chapters = sorted((chapter for chapter in self.indexed() if chapter.grade == grade and chapter.subject == subject), key=lambda c: int(c.chapter))
+        return [(f"{c.chapter}. {c.title}" if c.title else c.chapter, c.chapter) for c in chapters]
+
+    async def watch(self, interval: float = REGISTRY_REFRESH_INTERVAL):
+        """Background task that reloads the registry after ingestion runs elsewhere"""
+        while True:
+            await asyncio.sleep(interval)
+            self.refresh()
+
+    def refresh(self):
+        """Reloads the registry if another process changed it, calling on_change for
+        every chapter whose updated stamp changed"""
+        if not os.path.exists(self.path) or os.path.getmtime(self.path) == self.mtime:
+            return
+        previous = self.updated()
+        self.load()
+        current = self.updated()
+        changed = sorted(c for c in previous.keys() | current.keys() if previous.get(c) != current.get(c))
+        log.info("registry reloaded, %d collections, %d changed", len(self.chapters), len(changed))
+        for collection in changed:
+            for callback in self.on_change:
+                callback(collection)
+
+    def updated(self) -> dict[str, float]:
+        return {collection: chapter.updated for collection, chapter in self.chapters.items()}
+
+    def stats(self) -> dict:
+        return {"collections": len(self.indexed()), "chunks": sum(chapter.chunks for chapter in self.indexed())}
+
+
+def parse_collection(collection: str) -> tuple[str, str, str] | None:
+    match = COLLECTION_PATTERN.match(collection)
+    return match.groups() if match else None
+
+
+def parse_scope(collection: str) -> tuple[str, str, int | None, int | None] | None:
+    """(grade, subject, first chapter, last chapter), the chapters None for a whole book"""
+    match = SCOPE_PATTERN.match(collection)
+    if not match:
+        return None
+    grade, subject, first, last = match.groups()
+    first = int(first) if first else None
+    return grade, subject, first, int(last) if last else first
+
+
+def covers(scope: str, collection: str) -> bool:
+    """Whether a chapter, range or book name includes a chapter's collection"""
+    if scope == collection:
+        return True
+    outer, inner = parse_scope(scope), parse_collection(collection)
+    if not outer or not inner or outer[:2] != inner[:2]:
+        return False
+    return outer[2] is None or outer[2] <= int(inner[2]) <= outer[3]
+
+
+def chapter_title(chunks: list[dict]) -> str | None:
+    """Largest text on the first page, which in NCERT chapters is the title.
+    Structural chunks hold headings as their section, so those count too."""
+    if not chunks:
+        return None
+    first = min(chunk.get("page", 0) for chunk in chunks)
+    texts = []
+    for chunk in chunks:
+        if chunk.get("page", 0) == first:
+            texts.append((chunk["size"], chunk["text"]))
+            if chunk.get("section"):
+                texts.append((chunk["section_size"], chunk["section"]))
+    _, title = max(texts, key=lambda text: text[0])
+    return title.strip() or None
+
+
+registry = Registry()
+
+
+if __name__ == "__main__":
+    from client import HybridClient
+
+    registry.rebuild(HybridClient())
+    for chapter in sorted(registry.chapters.values(), key=lambda c: (int(c.grade), c.subject, int(c.chapter))):
+        print(f"{chapter.collection:<20} {chapter.chunks:>5} chunks  {chapter.title or ''}")
@@ -0,0 +1,124 @@
+"""Post-retrieval stage for the RAG prompt: rerank over-fetched hits with a
+cross-encoder, drop near-duplicates and pack the best chunks into a token budget.
+
+fastembed 0.3.6 has no cross-encoders, so the ONNX export of
+ms-marco-MiniLM-L-6-v2 is run directly with onnxruntime and tokenizers.
+"""
+
+import logging
+import re
+
+import numpy as np
+
+from backends import Hit
+from config import RAG_CONTEXT_TOKENS, RERANK_DEDUP_THRESHOLD, RERANK_ENABLED, RERANK_MODEL, RERANK_MODEL_FILE
+from tokens import count_tokens
+
+WORD = re.compile(r"\w+")
+log = logging.getLogger(__name__)
+
+
+class Reranker:
+    """Scores (query, passage) pairs on CPU. Loaded on first use; if the model
+    cannot be loaded, hits keep their fusion order."""
+
+    def __init__(self, model: str = RERANK_MODEL, model_file: str = RERANK_MODEL_FILE, max_length: int = 512, batch_size: int = 16):
+        self.model = model
+        self.model_file = model_file
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.session = None
+        self.tokenizer = None
+        self.failed = False
+
+    def load(self) -> bool:
+        if self.session is not None or self.failed:
+            return not self.failed
+        try:
+            import onnxruntime as ort
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+
+            self.tokenizer = Tokenizer.from_file(hf_hub_download(self.model, "tokenizer.json"))
+            self.tokenizer.enable_truncation(self.max_length)
+            self.tokenizer.enable_padding()
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = ort.InferenceSession(hf_hub_download(self.model, self.model_file), options, providers=["CPUExecutionProvider"])
+            self.inputs = {i.name for i in self.session.get_inputs()}
+        except Exception as e:
+            log.warning("reranker unavailable, using fusion order: %r", e)
+            self.failed = True
+        return not self.failed
+
+    def score(self, query: str, documents: list[str]) -> np.ndarray:
+        scores = []
+        for start in range(0, len(documents), self.batch_size):
+            encodings = self.tokenizer.encode_batch([(query, document) for document in documents[start : start + self.batch_size]])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.session.run(None, {name: value for name, value in feed.items() if name in self.inputs})[0]
+            scores.append(logits[:, 0])
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def rerank(self, query: str, hits: list[Hit]) -> list[Hit]:
+        if not hits or not self.load():
+            return hits
+        scores = self.score(query, [hit.document for hit in hits])
+        order = np.argsort(-scores, kind="stable")
+        return [Hit(hits[i].id, hits[i].document, hits[i].metadata, float(scores[i])) for i in order]
+
+
+def dedupe(hits: list[Hit], threshold: float = RERANK_DEDUP_THRESHOLD) -> list[Hit]:
+    """Drops hits whose word set overlaps an earlier (better) hit by at least threshold (Jaccard)"""
+    kept, words = [], []
+    for hit in hits:
+        current = set(WORD.findall(hit.document.lower()))
+        if not current:
+            continue
+        if any(len(current & other) / len(current | other) >= threshold for other in words):
+            continue
+        kept.append(hit)
+        words.append(current)
+    return kept
+
+
+def pack(hits: list[Hit], budget: int = RAG_CONTEXT_TOKENS) -> list[Hit]:
+    """Best hits that fit the token budget, ordered by page (by relevance within a page)"""
+    packed, used = [], 0
+    for hit in hits:
+        tokens = count_tokens(hit.document)
+        if used + tokens > budget:
+            continue
+        packed.append(hit)
+        used += tokens
+    return sorted(packed, key=lambda hit: hit.metadata.get("page", 0))
+
+
+def page_label(hit: Hit) -> int | None:
+    """1-based page number for citations"""
+    page = hit.metadata.get("page")
+    return page + 1 if page is not None else None
+
+
+def build_context(query: str, hits: list[Hit], budget: int = RAG_CONTEXT_TOKENS) -> tuple[str, list[dict]]:
+    """Prompt context with page citations, and the sources it was built from"""
+    if RERANK_ENABLED:
+        hits = reranker.rerank(query, hits)
+    hits = pack(dedupe(hits), budget)
+
+    # Chapter ranges and whole-book searches cite the chapter too
+    if len({hit.metadata.get("chapter") for hit in hits}) > 1:
+        hits.sort(key=lambda hit: (hit.metadata.get("chapter", 0), hit.metadata.get("page", 0)))
+        context = "\n\n".join(f"[Chapter {hit.metadata.get('chapter')}, Page {page_label(hit)}] {hit.document}" for hit in hits)
+    else:
+        context = "\n\n".join(f"[Page {page_label(hit)}] {hit.document}" for hit in hits)
+    sources = [{"page": page_label(hit), "chapter": hit.metadata.get("chapter"), "text": hit.document, "score": hit.score} for hit in hits]
+    return context, sources
+
+
+reranker = Reranker()
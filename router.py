@@ -0,0 +1,195 @@
+import asyncio
+import re
+
+import numpy as np
+
+from config import ROUTER_ENABLED, ROUTER_MIN_MARGIN, ROUTER_MIN_SCORE
+from sarvam import code_map
+
+LANGUAGES = "|".join(code_map)
+
+URL_PATTERN = re.compile(r"(https?://[^\s\"'<>]+|www\.[^\s\"'<>]+)", re.IGNORECASE)
+QUOTES = "\"'“”‘’"
+
+TRANSLATE_PATTERNS = [
+    re.compile(rf"^(?:please\s+)?translate\s+(?P<source>.+?)\s+(?:to|into|in)\s+(?P<dest>{LANGUAGES})\W*$", re.IGNORECASE | re.DOTALL),
+    re.compile(rf"^(?:please\s+)?translate\s+(?:to|into|in)\s+(?P<dest>{LANGUAGES})\s*[:\-]?\s+(?P<source>.+)$", re.IGNORECASE | re.DOTALL),
+]
+
+SPEAK_VERBS = r"^(?:please\s+)?(?:speak|say|read|pronounce)\s+"
+SPEAK_PATTERNS = [
+    # Quoted text, or an explicit "aloud"/"in <language>"; unquoted sources that refer to
+    # the lesson ("read the chapter and ...") are rejected by clean_source
+    re.compile(SPEAK_VERBS + rf"(?:aloud\s+)?(?P<source>[\"“'].+[\"”'])(?:\s+(?:out loud|aloud))?(?:\s+in\s+(?P<dest>{LANGUAGES}))?\W*$", re.IGNORECASE | re.DOTALL),
+    re.compile(SPEAK_VERBS + rf"(?P<source>.+?)\s+(?:out loud|aloud)(?:\s+in\s+(?P<dest>{LANGUAGES}))?\W*$", re.IGNORECASE | re.DOTALL),
+    re.compile(SPEAK_VERBS + rf"(?P<source>.+?)\s+in\s+(?P<dest>{LANGUAGES})\W*$", re.IGNORECASE | re.DOTALL),
+    re.compile(rf"^(?:please\s+)?convert\s+(?P<source>.+?)\s+(?:to|into)\s+(?:speech|audio)(?:\s+in\s+(?P<dest>{LANGUAGES}))?\W*$", re.IGNORECASE | re.DOTALL),
+]
+
+# Labelled seed utterances for the embedding classifier. Only "retriever" is
+# fast-pathed through it; the other labels exist to measure the margin against.
+EXAMPLES = {
+    "retriever": [
+        "What is photosynthesis?",
+        "Explain the structure of an atom",
+        "Why do objects float in water?",
+        "What are the causes of the French Revolution?",
+        "Define force and give an example",
+        "How does sound travel through a medium?",
+        "Summarize this chapter",
+        "What is the difference between mass and weight?",
+        "Give me the important points of the lesson",
+        "Describe the activity about evaporation",
+        "What did the textbook say about democracy?",
+        "How are rainbows formed?",
+    ],
+    "none": [
+        "Hi, how are you?",
+        "Hello",
+        "Thank you so much!",
+        "Tell me a joke",
+        "Who won the cricket world cup?",
+        "What is your name?",
+        "What is the weather like today?",
+        "Can you help me?",
+        "Good morning",
+        "Which movie should I watch tonight?",
+    ],
+    "translator": [
+        "Translate this sentence to Hindi",
+        "What is the Tamil translation of this?",
+        "Can you convert this into Bengali?",
+    ],
+    "speaker": [
+        "Read this aloud",
+        "Convert this text to speech",
+        "Say this in Marathi",
+    ],
+    "extractor": [
+        "Summarize this web page",
+        "What does this link say?",
+        "Extract the main points from this website",
+    ],
+}
+
+
+def default_result(function, **kwargs):
+    """Mirrors the output_format of call_agent so function_caller can consume either"""
+    return {
+        "function": function,
+        "keywords": [],
+        "src_lang": "english",
+        "dest_lang": "none",
+        "source": "none",
+        "url": "none",
+        "response": None,
+        "router": "local",
+    } | kwargs
+
+
+# Sources like "this sentence" refer to earlier context, which only the LLM router can resolve
+DEICTIC_PATTERN = re.compile(r"^(?:this|that|it|these|those|the above|above)(?:\s+(?:sentence|text|line|paragraph|answer|word|words))?$", re.IGNORECASE)
+# Unquoted sources with these words ask about the lesson ("the chapter summary", "something about
+# photosynthesis") rather than giving the text to translate or speak
+REFERENTIAL_PATTERN = re.compile(
+    r"\b(?:chapter|lesson|paragraph|passage|summary|page|section|line|sentence|topic|answer|question|notes?|something|anything|about|explain|tell me|what|why|how)\b",
+    re.IGNORECASE,
+)
+# "the sentence 'power is ...'" -> "'power is ...'"
+LEAD_PATTERN = re.compile(r"^(?:the\s+)?(?:following\s+)?(?:sentence|text|word|words|phrase|line)\s*[:\-]?\s+(?=\S)", re.IGNORECASE)
+
+
+def clean_source(match):
+    source = LEAD_PATTERN.sub("", match["source"].strip())
+    quoted = source[:1] in QUOTES
+    source = source.strip(QUOTES + " ").strip()
+    if not quoted:
+        source = source.rstrip(".,;:!?").strip()
+    if not source or not source.isascii() or DEICTIC_PATTERN.match(source):
+        return None
+    if not quoted and REFERENTIAL_PATTERN.search(source):
+        return None
+    return source
+
+
+def clean_url(url: str) -> str:
+    """Drops sentence punctuation after a URL, keeping balanced parentheses (".../Energy_(physics)")"""
+    while url and url[-1] in ".,;:!?)]}":
+        if url[-1] == ")" and url.count("(") >= url.count(")"):
+            break
+        url = url[:-1]
+    return url
+
+
+class Router:
+    """Local routing stage in front of the LLM router. Returns a decision only
+    when it is confident; ambiguous queries return None."""
+
+    def __init__(self, min_score: float = ROUTER_MIN_SCORE, min_margin: float = ROUTER_MIN_MARGIN):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.labels = None
+        self.matrix = None
+
+    def fit(self, client):
+        texts = [text for examples in EXAMPLES.values() for text in examples]
+        self.labels = np.array([label for label, examples in EXAMPLES.items() for _ in examples])
+        self.matrix = normalize(np.array(client.embed(texts)))
+
+    def classify(self, vector, client) -> tuple[str, float, float]:
+        """Returns (label, score, margin) of a query vector, from the top-3 mean similarity per label"""
+        if self.matrix is None:
+            self.fit(client)
+
+        similarities = self.matrix @ normalize(np.array([vector]))[0]
+
+        scores = {}
+        for label in EXAMPLES:
+            top = np.sort(similarities[self.labels == label])[-3:]
+            scores[label] = float(top.mean())
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (label, score), (_, runner_up) = ranked[0], ranked[1]
+        return label, score, score - runner_up
+
+    def match_rules(self, query: str) -> dict | None:
+        url = URL_PATTERN.search(query)
+        if url:
+            return default_result("extractor", url=clean_url(url.group(0)))
+
+        for pattern in TRANSLATE_PATTERNS:
+            match = pattern.match(query.strip())
+            source = match and clean_source(match)
+            if source:
+                return default_result("translator", source=source, dest_lang=match["dest"].lower())
+
+        for pattern in SPEAK_PATTERNS:
+            match = pattern.match(query.strip())
+            source = match and clean_source(match)
+            if source:
+                return default_result("speaker", source=source, dest_lang=(match["dest"] or "english").lower())
+
+        return None
+
+    async def route(self, query: str, client) -> dict | None:
+        if not ROUTER_ENABLED:
+            return None
+
+        result = self.match_rules(query)
+        if result:
+            return result
+
+        if self.matrix is None:
+            # Without warmup (e.g. python ui.py) the seed utterances are embedded here, off the event loop
+            await asyncio.to_thread(self.fit, client)
+        label, score, margin = self.classify(await client.aembed(query), client)
+        if label == "retriever" and score >= self.min_score and margin >= self.min_margin:
+            return default_result("retriever")
+        return None
+
+
+def normalize(matrix):
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+router = Router()
@@ -1,8 +1,17 @@
+import asyncio
+import json
 import os
+import random
+import re
 
 import aiohttp
 from dotenv import load_dotenv
 
+from audio_store import audio_store
+from config import SARVAM_MAX_CONCURRENCY, SARVAM_MAX_RETRIES, SARVAM_TIMEOUT
+from metrics import Span
+from speech_cache import speech_cache
+
 load_dotenv()
 
 code_map = {
@@ -19,10 +28,105 @@ code_map = {
     "gujarati": "gu-IN",
 }
 
+TRANSLATE_MODEL = "mayura:v1"
+TTS_MODEL = "bulbul:v1"
+TTS_SPEAKER = "meera"
+TTS_PACE = 1.25
+TTS_SAMPLE_RATE = 8000
 
-async def translator(text, src, dest):
-    async with aiohttp.ClientSession() as session:
-        url = "https://api.sarvam.ai/translate"
+# bulbul:v1 accepts up to 3 inputs of at most 500 characters per request
+TTS_MAX_INPUTS = 3
+TTS_MAX_CHARS = 500
+
+SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+
+
+class SarvamError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Sarvam API error {status}: {message}")
+        self.status = status
+
+
+class SarvamClient:
+    """Long-lived Sarvam API client with a pooled connector, timeouts, bounded
+    concurrency, retries with jitter, and coalescing of identical in-flight requests.
+    Translations and audio are served from `cache` when possible."""
+
+    BASE_URL = "https://api.sarvam.ai"
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_concurrency: int = SARVAM_MAX_CONCURRENCY, timeout: float = SARVAM_TIMEOUT, max_retries: int = SARVAM_MAX_RETRIES, store=audio_store, cache=None):
+        self.store = store
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = None
+        self.semaphore = None
+        self.inflight = {}
+        self.counters = {"requests": 0, "retries": 0, "errors": 0, "coalesced": 0}
+
+    async def start(self):
+        if self.session is not None:
+            return
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=5),
+            headers={"Content-Type": "application/json", "api-subscription-key": os.getenv("SARVAM_API_KEY") or ""},
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def post(self, path: str, payload: dict) -> dict:
+        """Identical concurrent requests share one upstream call"""
+        key = (path, json.dumps(payload, sort_keys=True))
+        if key in self.inflight:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(self.inflight[key])
+
+        task = asyncio.ensure_future(self._post(path, payload))
+        self.inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self.inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        await self.start()
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    self.counters["requests"] += 1
+                    async with self.session.post(self.BASE_URL + path, json=payload) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        message = await response.text()
+                        if response.status not in self.RETRY_STATUSES or attempt == self.max_retries:
+                            self.counters["errors"] += 1
+                            raise SarvamError(response.status, message)
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    self.counters["errors"] += 1
+                    raise SarvamError(0, repr(e)) from e
+                retry_after = None
+
+            self.counters["retries"] += 1
+            # Exponential backoff with full jitter, unless the server said how long to wait
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else random.uniform(0, 0.5 * 2**attempt)
+            await asyncio.sleep(delay)
+
+    async def translate(self, text, src, dest):
+        # Cache lookups are SQLite calls, run in a thread to keep them off the event loop
+        if self.cache and (cached := await asyncio.to_thread(self.cache.get_translation, text, src, dest, TRANSLATE_MODEL)) is not None:
+            return {"text": cached}
 
         payload = {
             "input": text,
@@ -30,44 +134,87 @@ async def translator(text, src, dest):
             "target_language_code": code_map[dest],
             "speaker_gender": "Male",
             "mode": "formal",
-            "model": "mayura:v1",
+            "model": TRANSLATE_MODEL,
             "enable_preprocessing": True,
         }
-        headers = {"Content-Type": "application/json", "api-subscription-key": os.getenv("SARVAM_API_KEY")}
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                output = await response.json()
-                return {"text": output["translated_text"]}
-
-
-async def speaker(text, src="hindi"):
-    async with aiohttp.ClientSession() as session:
-        url = "https://api.sarvam.ai/text-to-speech"
+        output = await self.post("/translate", payload)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put_translation, text, src, dest, TRANSLATE_MODEL, output["translated_text"])
+        return {"text": output["translated_text"]}
 
+    async def tts(self, inputs: list[str], src="hindi") -> list[str]:
         payload = {
-            "inputs": [text],
+            "inputs": inputs,
             "target_language_code": code_map[src],
-            "speaker": "meera",
+            "speaker": TTS_SPEAKER,
             "pitch": 0,
-            "pace": 1.25,
+            "pace": TTS_PACE,
             "loudness": 1.5,
-            "speech_sample_rate": 8000,
+            "speech_sample_rate": TTS_SAMPLE_RATE,
             "enable_preprocessing": True,
-            "model": "bulbul:v1",
+            "model": TTS_MODEL,
         }
-        headers = {"Content-Type": "application/json", "api-subscription-key": os.getenv("SARVAM_API_KEY")}
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                output = await response.json()
-                return output
-            else:
-                print(response.status)
+        output = await self.post("/text-to-speech", payload)
+        return output["audios"]
+
+    async def speak(self, text, src="hindi") -> list[str]:
+        """Splits long text at sentence boundaries and synthesizes batches of
+        pieces in parallel; returns the base64 WAV clips in order"""
+        pieces = split_text(text, TTS_MAX_CHARS)
+        batches = [pieces[i : i + TTS_MAX_INPUTS] for i in range(0, len(pieces), TTS_MAX_INPUTS)]
+        results = await asyncio.gather(*(self.tts(batch, src) for batch in batches))
+        return [audio for result in results for audio in result]
+
+    async def speak_file(self, text, src="hindi") -> str:
+        """Name of a clip in the audio store with the spoken text, synthesized only on a cache miss"""
+        params = (text, src, TTS_SPEAKER, TTS_PACE, TTS_SAMPLE_RATE)
+        if self.cache and (name := await asyncio.to_thread(self.cache.get_audio, *params)):
+            return name
+        name = await asyncio.to_thread(self.store.save_clips, await self.speak(text, src))
+        if self.cache:
+            await asyncio.to_thread(self.cache.put_audio, *params, name)
+        return name
+
+    def stats(self) -> dict:
+        return self.counters | {"in_flight": len(self.inflight)}
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """Packs sentences into pieces of at most max_chars, splitting overlong sentences at spaces"""
+    pieces, current = [], ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
 
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+sarvam_client = SarvamClient(cache=speech_cache)
+
+
+async def translator(text, src, dest):
+    with Span("translator") as span:
+        span.size("in", len(text.encode()))
+        result = await sarvam_client.translate(text, src, dest)
+        span.size("out", len(result["text"].encode()))
+        return result
+
+
+async def speaker(text, src="hindi"):
+    with Span("speaker") as span:
+        span.size("in", len(text.encode()))
+        name = await sarvam_client.speak_file(text, src)
+        if (path := sarvam_client.store.path(name)) is not None:
+            span.size("out", os.path.getsize(path))
+        return {"audio": name}
 
-def save_audio(audio_data):
-    os.makedirs("audio_files", exist_ok=True)
-    file_count = len(os.listdir("audio_files"))
-    file_path = f"audio_files/audio_{file_count + 1}.wav"
-    with open(file_path, "wb") as audiofile:
-        audiofile.write(audio_data)
-    return file_path
@@ -1,16 +1,26 @@
 import asyncio
 import base64
+import codecs
 import io
 import json
+import logging
 import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
 from string import ascii_lowercase
 
 import aiohttp
-from bs4 import BeautifulSoup, Comment, Declaration
+import numpy as np
 
-from client import HybridClient
+from config import EXTRACT_CONTEXT_TOKENS, EXTRACT_MAX_BYTES, EXTRACT_PASSAGE_TOKENS, EXTRACT_TIMEOUT, NCERT_BASE_URL
 from headers import random_headers
-from preprocessing import index_pdf
+from logs import fields
+from metrics import Span
+from page_cache import PageCache, page_cache
+from pdf_cache import PDFCache
+from tokens import count_tokens
+
+log = logging.getLogger(__name__)
 
 grade_map = ascii_lowercase[:12]
 
@@ -25,63 +35,91 @@ subject_map = {
 
 def get_url(grade, subject, chapter):
     filename = grade_map[grade - 1] + subject_map[subject] + str(chapter).zfill(2)
-    url = f"https://ncert.nic.in/textbook/pdf/{filename}.pdf"
-    print(url)
+    url = f"{NCERT_BASE_URL}/textbook/pdf/{filename}.pdf"
+    log.debug("chapter url %s", url)
     return url
 
 
-async def get_book(grade, subject, chapters=None):
+async def get_book(grade, subject, chapters=None, concurrency=4, cache=None):
     book = {}
-    if not chapters:
-        chapters = range(1, 20)
+    cache = cache or PDFCache()
+    semaphore = asyncio.Semaphore(concurrency)
 
-    async with aiohttp.ClientSession() as session:
-        print("Downloaded - ", end="")
-        for i in chapters:
-            url = get_url(grade, subject, i)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        if not chapters:
+            chapters = range(1, await probe(session, grade, subject) + 1)
 
-            pdf = await download(session, url)
+        async def fetch(i):
+            async with semaphore:
+                return await download(session, get_url(grade, subject, i), cache=cache)
 
-            if pdf:
-                collection = f"{grade}_{subject}_{i}"
-                print(i, end="")
-                book[collection] = pdf
-            else:
-                break
-    print()
+        pdfs = await asyncio.gather(*(fetch(i) for i in chapters))
+
+    for i, pdf in zip(chapters, pdfs):
+        # Stop at the first missing chapter, as the sequential version did
+        if not pdf:
+            break
+        book[f"{grade}_{subject}_{i}"] = pdf
+    log.info("downloaded book", extra=fields(grade=grade, subject=subject, chapters=len(book)))
     return book
 
 
-async def download(session: aiohttp.ClientSession, url: str, max_retries: int = 3) -> io.BytesIO | None:
+async def probe(session: aiohttp.ClientSession, grade, subject, max_chapters: int = 19) -> int:
+    """Number of chapters in a book, found with HEAD requests instead of downloads"""
+
+    async def exists(i):
+        url = get_url(grade, subject, i)
+        try:
+            async with session.head(url, headers=random_headers(), timeout=10, allow_redirects=True) as r:
+                if r.status != 405:
+                    return r.status == 200
+            # Servers without HEAD support get a one-byte range request
+            async with session.get(url, headers={"Range": "bytes=0-0"} | random_headers(), timeout=10) as r:
+                return r.status in (200, 206)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    found = await asyncio.gather(*(exists(i) for i in range(1, max_chapters + 1)))
+    return found.index(False) if False in found else max_chapters
+
+
+async def download(session: aiohttp.ClientSession, url: str, max_retries: int = 3, cache: PDFCache = None) -> io.BytesIO | None:
     for attempt in range(max_retries):
         try:
             headers = {"Accept": "application/pdf"} | random_headers()
+            if cache:
+                headers |= cache.validators(url)
+
             async with session.get(url, headers=headers, timeout=10) as r:
+                if r.status == 304:
+                    return io.BytesIO(cache.get(url))
+                if r.status == 404:
+                    return None
                 r.raise_for_status()
                 content = await r.read()
-                return io.BytesIO(content)
+
+            if cache:
+                cache.put(url, content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+            return io.BytesIO(content)
         except Exception as e:
-            print(f"Attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
+                log.warning("download attempt %d failed: %r", attempt + 1, e, extra=fields(url=url))
                 await asyncio.sleep(2 ** (attempt + 1))
             else:
-                print(f"Max retries reached. Unable to download PDF from {url}")
-        return None
+                log.error("max retries reached, unable to download PDF: %r", e, extra=fields(url=url))
+    return None
 
 
 async def upload_book(grade, subject, chapters=None):
-    hclient = HybridClient()
+    from ingest import ingest_book
 
-    book = await get_book(grade, subject, chapters)
-    for collection, pdf in book.items():
-        print(collection)
-        chunks = index_pdf(pdf, buffer=True)
-
-        hclient.create(collection)
-        hclient.insert(collection, chunks)
+    await ingest_book(grade, subject, chapters)
 
 
 async def save_book_to_json(grade, subject, chapters=None):
+    # Offline only: keeps PyMuPDF out of the API's imports
+    from preprocessing import index_pdf
+
     book = await get_book(grade, subject, chapters)
     result = {}
 
@@ -105,6 +143,8 @@ async def save_book_to_json(grade, subject, chapters=None):
 
 
 def upload_book_from_json(json_file_path):
+    from client import HybridClient
+
     hclient = HybridClient()
 
     with open(json_file_path, "r") as f:
@@ -121,28 +161,207 @@ def upload_book_from_json(json_file_path):
                     chunk[key] = value
             chunks.append(chunk)
 
-        hclient.create(collection)
-        hclient.insert(collection, chunks)
-
-
-def is_visible_text(element):
-    if element.parent.name in ["style", "script", "[document]", "head", "title"]:
-        return False
-    elif re.match("<!--.*-->", str(element)):
-        return False
-    elif type(element) is Comment or type(element) is Declaration:
-        return False
-    elif len(str(element)) < 50:
-        return False
-    return True
-
-
-async def extract(url: str):
-    async with aiohttp.ClientSession() as session:
-        headers = random_headers()
-        async with session.get(url, headers=headers, timeout=10) as r:
-            r.raise_for_status()
-            content = await r.read()
-            texts = BeautifulSoup(content, "html.parser").findAll(string=True)
-            text = "".join(list(filter(is_visible_text, texts)))
-            return text
+        log.info("synced", extra=fields(collection=collection, **hclient.sync(collection, chunks)))
+
+
+class ExtractError(Exception):
+    pass
+
+
+# Subtrees that never hold a page's main content
+SKIP_TAGS = {"head", "script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form", "iframe", "button", "select"}
+BLOCK_TAGS = {
+    *("p", "div", "section", "article", "main", "li", "ul", "ol", "pre", "blockquote", "table", "tr", "td", "th"),
+    *("dl", "dt", "dd", "figcaption", "caption", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6"),
+}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+MAIN_TAGS = {"main", "article"}
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+
+
+@dataclass
+class Block:
+    text: str
+    link_density: float
+    main: bool
+    heading: bool
+
+
+class PageParser(HTMLParser):
+    """Incremental HTML to text blocks, fed as the body streams in. Keeps no tree:
+    text is split at block-level tags, with the share of it inside links and
+    whether it is inside <main> or <article>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.parts = []
+        self.link_chars = 0
+        self.skip = self.links = self.main = 0
+        self.heading = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip += 1
+        elif tag in BLOCK_TAGS:
+            self.flush()
+            self.heading = tag in HEADING_TAGS
+        if tag == "a":
+            self.links += 1
+        elif tag in MAIN_TAGS:
+            self.main += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip = max(self.skip - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.flush()
+        if tag == "a":
+            self.links = max(self.links - 1, 0)
+        elif tag in MAIN_TAGS:
+            self.main = max(self.main - 1, 0)
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        self.parts.append(data)
+        if self.links:
+            self.link_chars += len(data.strip())
+
+    def flush(self):
+        text = " ".join("".join(self.parts).split())
+        if text:
+            self.blocks.append(Block(text, min(self.link_chars / len(text), 1.0), self.main > 0, self.heading))
+        self.parts, self.link_chars, self.heading = [], 0, False
+
+    def close(self):
+        super().close()
+        self.flush()
+
+
+class TextParser:
+    """Plain text pages, split into paragraphs at blank lines"""
+
+    def __init__(self):
+        self.parts = []
+        self.blocks = []
+
+    def feed(self, data):
+        self.parts.append(data)
+
+    def close(self):
+        for paragraph in re.split(r"\n\s*\n", "".join(self.parts)):
+            text = " ".join(paragraph.split())
+            if text:
+                self.blocks.append(Block(text, 0.0, False, False))
+
+
+def main_content(blocks: list[Block], min_chars: int = 40, max_link_density: float = 0.5) -> list[str]:
+    """Drops boilerplate: link lists, short fragments, and everything outside
+    <main>/<article> when those hold most of the page's text"""
+    inside = [block for block in blocks if block.main]
+    if sum(len(block.text) for block in inside) >= 0.5 * sum(len(block.text) for block in blocks):
+        blocks = inside
+    return [block.text for block in blocks if block.link_density <= max_link_density and (block.heading or len(block.text) >= min_chars)]
+
+
+async def read_page(response: aiohttp.ClientResponse, span: Span, max_bytes: int = EXTRACT_MAX_BYTES) -> list[str]:
+    """Streams the body into the parser, stopping at max_bytes"""
+    content_type = response.content_type
+    if content_type not in HTML_TYPES and content_type != "text/plain":
+        raise ExtractError(f"unsupported content type {content_type}")
+
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parser = PageParser() if content_type in HTML_TYPES else TextParser()
+
+    size = 0
+    async for data in response.content.iter_chunked(64 * 1024):
+        data = data[: max_bytes - size]
+        size += len(data)
+        parser.feed(decoder.decode(data))
+        if size >= max_bytes:
+            log.info("page truncated", extra=fields(url=str(response.url), max_bytes=max_bytes))
+            break
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    span.size("in", size)
+    return main_content(parser.blocks)
+
+
+async def fetch_page(url: str, span: Span, cache: PageCache = page_cache) -> list[str]:
+    """Main-content blocks of a page, from the cache when it is fresh or still valid"""
+    # SQLite calls run in a thread, to keep them off the event loop
+    page = await asyncio.to_thread(cache.get, url)
+    if page and page["fresh"]:
+        await asyncio.to_thread(cache.hit, url)
+        return page["blocks"]
+
+    headers = random_headers() | cache.validators(page)
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=EXTRACT_TIMEOUT)) as session:
+            async with session.get(url, headers=headers) as r:
+                if r.status == 304 and page:
+                    await asyncio.to_thread(cache.hit, url, True)
+                    return page["blocks"]
+                r.raise_for_status()
+                blocks = await read_page(r, span)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        raise ExtractError(f"could not fetch {url}: {e!r}") from e
+
+    await asyncio.to_thread(cache.put, url, blocks, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return blocks
+
+
+def split_passages(blocks: list[str], max_tokens: int = EXTRACT_PASSAGE_TOKENS) -> list[str]:
+    """Consecutive blocks joined into passages of up to max_tokens; longer blocks are split"""
+    words_per_passage = max(max_tokens * 3 // 4, 1)
+    pieces = []
+    for block in blocks:
+        words = block.split()
+        pieces += [" ".join(words[i : i + words_per_passage]) for i in range(0, len(words), words_per_passage)]
+
+    passages, current, used = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and used + tokens > max_tokens:
+            passages.append("\n".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += tokens
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+async def select_passages(passages: list[str], query: str | None, client, budget: int) -> list[str]:
+    """Passages most similar to the query that fit the token budget, in page order"""
+    tokens = [count_tokens(passage) for passage in passages]
+    if sum(tokens) <= budget:
+        return passages
+
+    order = range(len(passages))
+    if query and client is not None:
+        query_vector = np.asarray(await client.aembed(query))
+        vectors = np.asarray(await client.aembed_passages(passages))
+        scores = vectors @ query_vector / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-9)
+        order = np.argsort(-scores, kind="stable")
+
+    chosen, used = [], 0
+    for i in order:
+        if used + tokens[i] <= budget:
+            chosen.append(i)
+            used += tokens[i]
+    return [passages[i] for i in sorted(chosen)]
+
+
+async def extract(url: str, query: str | None = None, client=None, budget: int = EXTRACT_CONTEXT_TOKENS) -> str:
+    """Main text of a web page, reduced to the passages most relevant to query
+    (ranked with the client's embedding model) within a token budget"""
+    with Span("extract") as span:
+        passages = split_passages(await fetch_page(url, span), min(EXTRACT_PASSAGE_TOKENS, budget))
+        text = "\n\n".join(await select_passages(passages, query, client, budget))
+        span.size("out", len(text.encode()))
+        return text
@@ -0,0 +1,117 @@
+import json
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_MAX_BYTES,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+)
+from registry import covers
+
+
+class SemanticCache:
+    """Final answers keyed by (collection, query embedding). A lookup hits when a
+    cached query in the same collection is within the cosine similarity threshold."""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        max_bytes: int = SEMANTIC_CACHE_MAX_BYTES,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()  # key -> (collection, vector, response, created, size), in LRU order
+        self.keys = defaultdict(list)  # collection -> keys
+        self.matrices = {}  # collection -> stacked vectors of self.keys[collection]
+        self.next_key = 0
+        self.bytes = 0
+
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "lookup_time": 0.0}
+
+    def get(self, collection: str, vector):
+        start = time.perf_counter()
+        response = self._lookup(collection, vector)
+        self.counters["lookup_time"] += time.perf_counter() - start
+        self.counters["hits" if response is not None else "misses"] += 1
+        return response
+
+    def _lookup(self, collection, vector):
+        keys = self.keys.get(collection)
+        if not keys:
+            return None
+
+        if collection not in self.matrices:
+            self.matrices[collection] = np.stack([self.entries[key][1] for key in keys])
+        similarities = self.matrices[collection] @ normalize(vector)
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+
+        key = keys[best]
+        _, _, response, created, _ = self.entries[key]
+        if time.monotonic() - created > self.ttl:
+            self._remove(key)
+            return None
+
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, collection: str, vector, response):
+        vector = normalize(vector)
+        size = vector.nbytes + len(json.dumps(response, default=str))
+        if size > self.max_bytes:
+            return
+
+        key = self.next_key
+        self.next_key += 1
+        self.entries[key] = (collection, vector, response, time.monotonic(), size)
+        self.keys[collection].append(key)
+        self.matrices.pop(collection, None)
+        self.bytes += size
+
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        collection, _, _, _, size = self.entries.pop(key)
+        self.keys[collection].remove(key)
+        if not self.keys[collection]:
+            del self.keys[collection]
+        self.matrices.pop(collection, None)
+        self.bytes -= size
+
+    def invalidate(self, collection: str):
+        """Drops the answers for a collection, including those for chapter ranges and whole books that contain it"""
+        for name in [name for name in self.keys if covers(name, collection)]:
+            for key in self.keys.pop(name):
+                self.bytes -= self.entries.pop(key)[4]
+            self.matrices.pop(name, None)
+        self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return self.counters | {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "lookup_avg_ms": self.counters["lookup_time"] / lookups * 1000 if lookups else 0.0,
+        }
+
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+answer_cache = SemanticCache()
@@ -0,0 +1,42 @@
+"""Singletons and startup steps shared by the API (api.py) and the Gradio UI (ui.py),
+so that `python ui.py` runs without importing the FastAPI app."""
+
+import re
+
+from client import HybridClient
+from config import COLLECTION_LAYOUT, RERANK_ENABLED
+from registry import registry
+from rerank import reranker
+from router import router
+from semantic_cache import answer_cache
+
+hclient = HybridClient()
+hclient.on_insert.append(answer_cache.invalidate)
+# Ingestion normally runs in another process, which is only visible through the registry
+registry.on_change.append(answer_cache.invalidate)
+
+
+def collection_name(grade, subject, chapter):
+    """Collection name for a chapter, a chapter range ("3-5") or, with "all", the whole book.
+    Raises ValueError for anything else."""
+    if chapter.isdigit():
+        return f"{grade}_{subject.lower()}_{chapter}"
+    if COLLECTION_LAYOUT != "subject" or not re.fullmatch(r"all|\d+-\d+", chapter):
+        raise ValueError("chapter must be a number, or with COLLECTION_LAYOUT=subject a range like 3-5 or all")
+    return f"{grade}_{subject.lower()}" if chapter == "all" else f"{grade}_{subject.lower()}_{chapter}"
+
+
+def load_registry():
+    registry.load()
+    # Deployments indexed before the registry existed get it built once from the vector store
+    if not registry.chapters:
+        registry.rebuild(hclient)
+
+
+def warmup():
+    """Loads the vector store, embedding models, router examples and reranker and
+    runs each once, so the first request does not pay for model initialization"""
+    hclient.warmup()
+    router.fit(hclient)
+    if RERANK_ENABLED and reranker.load():
+        reranker.score("warmup", ["warmup"])
@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+from metrics import SPECULATION_HEAD_START, SPECULATION_WASTED, SPECULATIONS
+
+
+class Speculation:
+    """Work started before the router has decided whether it is needed. Once it
+    has, the caller either keeps it and awaits `task`, or discards it, cancelling
+    whatever is still running. Streamed results are read from `queue`, which the
+    work ends with None."""
+
+    def __init__(self, level: str, coroutine, queue: asyncio.Queue | None = None):
+        self.level = level
+        self.queue = queue
+        self.start = time.perf_counter()
+        self.finished = None
+        self.task = asyncio.create_task(coroutine)
+        self.task.add_done_callback(self.done)
+
+    def done(self, task):
+        self.finished = time.perf_counter()
+        # A discarded task's error is never awaited
+        if not task.cancelled():
+            task.exception()
+
+    def keep(self):
+        SPECULATIONS.inc(level=self.level, outcome="kept")
+        SPECULATION_HEAD_START.observe(time.perf_counter() - self.start, level=self.level)
+
+    async def stream(self):
+        """Yields the queued items as they arrive"""
+        while (item := await self.queue.get()) is not None:
+            yield item
+
+    def discard(self):
+        self.task.cancel()
+        SPECULATIONS.inc(level=self.level, outcome="discarded")
+        SPECULATION_WASTED.observe((self.finished or time.perf_counter()) - self.start, level=self.level)
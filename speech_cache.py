@@ -0,0 +1,100 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from audio_store import AudioStore, audio_store
+from config import SPEECH_CACHE_DIR, SPEECH_CACHE_MAX_TRANSLATIONS
+
+
+class SpeechCache:
+    """Persistent cache of Sarvam translations and synthesized audio.
+
+    Translations are keyed by (text hash, src, dest, model) and audio by
+    (text hash, lang, speaker, pace, sample rate). Both indexes live in one
+    SQLite file. Audio entries point at clips in the audio store, which owns the
+    files and their retention; translations are evicted least recently used first.
+    Methods do blocking SQLite calls; async callers run them in a thread."""
+
+    def __init__(self, root: str = SPEECH_CACHE_DIR, store: AudioStore = audio_store, max_translations: int = SPEECH_CACHE_MAX_TRANSLATIONS):
+        self.root = root
+        self.store = store
+        self.max_translations = max_translations
+        self.lock = threading.Lock()
+        self._db = None
+        # Row counts, kept in memory instead of counted on every put or /status
+        self.translations = 0
+        self.clips = 0
+        self.counters = {"translation_hits": 0, "translation_misses": 0, "audio_hits": 0, "audio_misses": 0, "evictions": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.root, "cache.db"), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, text TEXT, accessed REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS clips (key TEXT PRIMARY KEY, name TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS translations_accessed ON translations (accessed)")
+            (self.translations,) = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()
+            (self.clips,) = self._db.execute("SELECT COUNT(*) FROM clips").fetchone()
+        return self._db
+
+    def get_translation(self, text, src, dest, model) -> str | None:
+        key = cache_key(text, src, dest, model)
+        with self.lock:
+            row = self.db.execute("SELECT text FROM translations WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.db.execute("UPDATE translations SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.counters["translation_hits" if row else "translation_misses"] += 1
+        return row[0] if row else None
+
+    def put_translation(self, text, src, dest, model, translated: str):
+        key = cache_key(text, src, dest, model)
+        with self.lock:
+            known = self.db.execute("SELECT 1 FROM translations WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?)", (key, translated, time.time()))
+            self.translations += not known
+            if self.translations > self.max_translations:
+                self.db.execute(
+                    "DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY accessed LIMIT ?)",
+                    (self.translations - self.max_translations,),
+                )
+                self.counters["evictions"] += self.translations - self.max_translations
+                self.translations = self.max_translations
+
+    def get_audio(self, text, lang, speaker, pace, sample_rate) -> str | None:
+        """Name of the cached clip in the audio store, if it is still there"""
+        key = cache_key(text, lang, speaker, pace, sample_rate)
+        with self.lock:
+            row = self.db.execute("SELECT name FROM clips WHERE key = ?", (key,)).fetchone()
+            if row and self.store.path(row[0]) is None:
+                self.db.execute("DELETE FROM clips WHERE key = ?", (key,))
+                self.clips -= 1
+                row = None
+        self.counters["audio_hits" if row else "audio_misses"] += 1
+        return row[0] if row else None
+
+    def put_audio(self, text, lang, speaker, pace, sample_rate, name: str):
+        key = cache_key(text, lang, speaker, pace, sample_rate)
+        with self.lock:
+            known = self.db.execute("SELECT 1 FROM clips WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO clips VALUES (?, ?)", (key, name))
+            self.clips += not known
+
+    def stats(self) -> dict:
+        self.db  # opening the database loads the row counts
+        rates = {}
+        for kind in ("translation", "audio"):
+            lookups = self.counters[f"{kind}_hits"] + self.counters[f"{kind}_misses"]
+            rates[f"{kind}_hit_rate"] = self.counters[f"{kind}_hits"] / lookups if lookups else 0.0
+        return self.counters | rates | {"translations": self.translations, "audio_clips": self.clips}
+
+
+def cache_key(text, *params) -> str:
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return hashlib.sha256("|".join([digest, *map(str, params)]).encode()).hexdigest()
+
+
+speech_cache = SpeechCache()
@@ -0,0 +1,47 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import client as client_module  # noqa: E402
+from backends import LocalBackend, SparseVector  # noqa: E402
+from client import HybridClient  # noqa: E402
+from registry import registry  # noqa: E402
+
+
+class FakeEmbedder:
+    """Deterministic vectors per text, so sync runs without downloading models"""
+
+    def __init__(self):
+        self.passages = 0
+
+    def vector(self, text):
+        return np.random.default_rng(zlib.crc32(text.encode())).random(HybridClient.DENSE_DIM, dtype=np.float32)
+
+    def embed_passages(self, texts):
+        self.passages += len(texts)
+        sparse = [SparseVector(np.array([zlib.crc32(text.encode()) % 1000]), np.array([1.0], dtype=np.float32)) for text in texts]
+        return [self.vector(text) for text in texts], sparse
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    """HybridClient on a local backend, with manifests and the registry under tmp_path"""
+    monkeypatch.setattr(client_module, "MANIFEST_DIR", str(tmp_path / "manifests"))
+    monkeypatch.setattr(registry, "path", str(tmp_path / "registry.json"))
+    monkeypatch.setattr(registry, "chapters", {})
+    monkeypatch.setattr(registry, "mtime", None)
+
+    def make(layout="chapter"):
+        hclient = HybridClient("local", layout)
+        hclient.backend = LocalBackend(str(tmp_path / "index"))
+        hclient.embedder = FakeEmbedder()
+        return hclient
+
+    return make
+
@@ -0,0 +1,64 @@
+import numpy as np
+
+from backends import Hit, LocalBackend, LocalIndex, SparseVector, reciprocal_rank_fusion
+
+
+def hits(*ids):
+    return [Hit(id, f"doc {id}", {}, 0.0) for id in ids]
+
+
+def test_reciprocal_rank_fusion_orders_by_summed_rank():
+    fused = reciprocal_rank_fusion([hits("a", "b", "c"), hits("c", "b", "d")])
+    assert [hit.id for hit in fused] == ["c", "b", "a", "d"]
+    assert fused[0].score == 1 / 4 + 1 / 2
+    assert fused[1].score == 1 / 3 + 1 / 3
+
+
+def test_reciprocal_rank_fusion_limit():
+    assert [hit.id for hit in reciprocal_rank_fusion([hits("a", "b", "c")], limit=2)] == ["a", "b"]
+
+
+def points(ids, chapter=1):
+    dense = [np.full(4, i + 1, dtype=np.float32) for i in range(len(ids))]
+    sparse = [SparseVector(np.array([i]), np.array([1.0], dtype=np.float32)) for i in range(len(ids))]
+    return ids, dense, sparse, [{"document": id, "chapter": chapter} for id in ids]
+
+
+def test_local_writes_are_applied_once(tmp_path, monkeypatch):
+    backend = LocalBackend(str(tmp_path))
+    backend.create("book", 4)
+    writes = []
+    original = LocalIndex.write
+    monkeypatch.setattr(LocalIndex, "write", classmethod(lambda cls, *args: writes.append(args[0]) or original(*args)))
+
+    with backend.writes("book"):
+        for id in "abcde":
+            backend.upsert("book", *points([id]))
+        backend.delete("book", ["b"])
+        assert backend.count("book") == 0  # searches see the previous index until the block ends
+
+    assert len(writes) == 1
+    assert sorted(hit.id for hit in backend.retrieve("book", list("abcde"))) == ["a", "c", "d", "e"]
+
+
+def test_local_writes_discarded_on_error(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.create("book", 4)
+    try:
+        with backend.writes("book"):
+            backend.upsert("book", *points(["a"]))
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert backend.count("book") == 0
+    assert "book" not in backend.pending
+
+
+def test_local_delete_by_filter(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.create("book", 4)
+    with backend.writes("book"):
+        backend.upsert("book", *points(["a", "b"], chapter=1))
+        backend.upsert("book", *points(["c"], chapter=2))
+        backend.delete("book", filter={"chapter": 1})
+    assert [hit.id for hit in backend.retrieve("book", ["a", "b", "c"])] == ["c"]
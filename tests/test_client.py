@@ -0,0 +1,51 @@
+from registry import registry
+
+
+def chunks(texts, page=1):
+    return [{"text": text, "page": page, "coordinates": [0, i], "size": 10, "color": 0} for i, text in enumerate(texts)]
+
+
+def test_sync_embeds_only_changed_chunks(make_client):
+    hclient = make_client()
+    assert hclient.sync("9_science_1", chunks(["a", "b", "c"])) == {"added": 3, "removed": 0, "unchanged": 0}
+
+    stats = hclient.sync("9_science_1", chunks(["a", "b", "d"]))
+    assert stats == {"added": 1, "removed": 1, "unchanged": 2}
+    assert hclient.embedder.passages == 4
+    assert hclient.backend.count("9_science_1") == 3
+    assert sorted(hit.document for hit in hclient.backend.retrieve("9_science_1", hclient.read_manifest("9_science_1"))) == ["a", "b", "d"]
+
+
+def test_sync_reembeds_when_backend_lost_points(make_client):
+    hclient = make_client()
+    hclient.sync("9_science_1", chunks(["a", "b", "c"]))
+    hclient.backend.delete_collection("9_science_1")
+
+    # The manifest still lists every chunk, but the collection is gone
+    assert hclient.sync("9_science_1", chunks(["a", "b", "c"])) == {"added": 3, "removed": 0, "unchanged": 0}
+    assert hclient.backend.count("9_science_1") == 3
+
+
+def test_sync_subject_layout_keeps_other_chapters(make_client):
+    hclient = make_client("subject")
+    hclient.sync("9_science_1", chunks(["a", "b"]))
+    hclient.sync("9_science_2", chunks(["c"]))
+    hclient.backend.delete("9_science", filter={"chapter": 2})
+
+    assert hclient.sync("9_science_2", chunks(["c"]))["added"] == 1
+    assert hclient.backend.count("9_science") == 3
+    assert hclient.backend.count("9_science", {"chapter": 1}) == 2
+
+
+def test_sync_records_chapter_and_notifies(make_client):
+    hclient = make_client()
+    inserted = []
+    hclient.on_insert.append(inserted.append)
+
+    hclient.sync("9_science_1", chunks(["a", "b"]))
+    assert inserted and set(inserted) == {"9_science_1"}
+    assert registry.get("9_science_1").chunks == 2
+
+    inserted.clear()
+    hclient.sync("9_science_1", chunks(["a", "b"]))
+    assert inserted == []
@@ -0,0 +1,62 @@
+from preprocessing import chunk_blocks, split_block, structural_chunks
+from registry import chapter_title
+from tokens import count_tokens
+
+
+def block(text, page=1, size=10, color=0):
+    return {"text": text, "page": page, "coordinates": [0, 0, 100, 10], "size": size, "color": color}
+
+
+def words(n, prefix="w"):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_split_block_bounds_long_sentences():
+    pieces = split_block(words(500), 60)
+    assert all(count_tokens(piece) <= 60 for piece in pieces)
+    assert " ".join(pieces).split() == words(500).split()
+
+
+def test_structural_chunks_stay_within_max_tokens():
+    blocks = [block("Work and Energy", size=16)] + [block(words(300, f"p{i}_") + ".", page=i) for i in range(1, 4)]
+    chunks = list(structural_chunks(blocks, max_tokens=64, overlap=0))
+    assert len(chunks) > 3
+    assert all(count_tokens(chunk["text"]) <= 64 for chunk in chunks)
+
+
+def test_structural_chunks_keep_every_word_and_prepend_heading():
+    body = [block(words(120, f"p{i}_") + ".", page=i) for i in range(1, 3)]
+    chunks = list(structural_chunks([block("Work and Energy", size=16)] + body, max_tokens=64, overlap=0))
+
+    assert all(chunk["text"].startswith("Work and Energy\n") for chunk in chunks)
+    assert all(chunk["section"] == "Work and Energy" and chunk["section_size"] == 16 for chunk in chunks)
+    text = " ".join(chunk["text"].removeprefix("Work and Energy\n") for chunk in chunks)
+    assert text.split() == " ".join(b["text"] for b in body).split()
+
+
+def test_structural_chunks_overlap():
+    blocks = [block(words(20, f"p{i}_") + ".") for i in range(10)]
+    chunks = list(structural_chunks(blocks, max_tokens=64, overlap=16))
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["text"].split()[0] in previous["text"].split()
+
+
+def test_structural_chunks_separate_boxes_and_activities():
+    blocks = [block(words(20) + "."), block("Activity 1.1 " + words(10)), block(words(10, "a"), size=9), block(words(10, "box"), color=255), block(words(20) + ".")]
+    kinds = [chunk["kind"] for chunk in structural_chunks(blocks, max_tokens=256, overlap=0)]
+    assert kinds == ["paragraph", "activity", "box", "paragraph"]
+
+
+def test_chunk_blocks_is_lazy():
+    def blocks():
+        for i in range(50):
+            yield block(words(20, f"p{i}_") + ".")
+        raise AssertionError("read past the lookahead")
+
+    assert next(iter(chunk_blocks(blocks(), "structural")))["text"]
+
+
+def test_chapter_title_uses_structural_sections():
+    chunks = list(structural_chunks([block("Work and Energy", size=16), block(words(20) + ".")], max_tokens=256, overlap=0))
+    assert chapter_title(chunks) == "Work and Energy"
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+from registry import Registry, covers
+from semantic_cache import SemanticCache
+
+
+def test_covers():
+    assert covers("9_science_1", "9_science_1")
+    assert covers("9_science", "9_science_4")
+    assert covers("9_science_3-5", "9_science_4")
+    assert not covers("9_science_3-5", "9_science_6")
+    assert not covers("9_science", "10_science_1")
+    assert not covers("9_science_1", "9_science_10")
+
+
+def test_invalidate_drops_answers_that_include_the_chapter():
+    cache = SemanticCache(threshold=0.9)
+    vector = np.ones(4, dtype=np.float32)
+    for collection in ("9_science_4", "9_science_3-5", "9_science", "9_science_6", "9_maths"):
+        cache.put(collection, vector, {"text": collection})
+
+    cache.invalidate("9_science_4")
+
+    assert cache.get("9_science_4", vector) is None
+    assert cache.get("9_science_3-5", vector) is None
+    assert cache.get("9_science", vector) is None
+    assert cache.get("9_science_6", vector) == {"text": "9_science_6"}
+    assert cache.get("9_maths", vector) == {"text": "9_maths"}
+    assert cache.stats()["entries"] == 2
+
+
+def test_refresh_reports_chapters_changed_by_another_process(tmp_path):
+    path = str(tmp_path / "registry.json")
+    ingest, api = Registry(path), Registry(path)
+    ingest.record("9_science_1", "Matter", 3)
+    ingest.record("9_science_2", "Atoms", 4)
+    api.load()
+    changed = []
+    api.on_change.append(changed.append)
+
+    api.refresh()
+    assert changed == []
+
+    ingest.record("9_science_2", "Atoms", 5)
+    ingest.record("9_science_3", None, 2)
+    os.utime(path, (0, api.mtime + 1))
+    api.refresh()
+
+    assert changed == ["9_science_2", "9_science_3"]
+    assert api.get("9_science_2").chunks == 5
+
+
+def test_get_does_not_store_unregistered_names(tmp_path):
+    registry = Registry(str(tmp_path / "registry.json"))
+    assert registry.get("9_science_3-5").chapter == "3-5"
+    assert registry.get("9_science").chapter == "all"
+    assert registry.chapters == {}
@@ -0,0 +1,46 @@
+import pytest
+
+from router import Router
+
+
+@pytest.mark.parametrize(
+    "query, function, source, dest",
+    [
+        ('translate "energy is the capacity to do work" to hindi', "translator", "energy is the capacity to do work", "hindi"),
+        ("Translate into tamil: the object moves with constant velocity", "translator", "the object moves with constant velocity", "tamil"),
+        ("say welcome to class in hindi", "speaker", "welcome to class", "hindi"),
+        ("convert the sentence 'power is the rate of doing work' to speech", "speaker", "power is the rate of doing work", "english"),
+        ('read "work is done when a force moves an object" aloud', "speaker", "work is done when a force moves an object", "english"),
+    ],
+)
+def test_rules_extract_source_and_language(query, function, source, dest):
+    result = Router().match_rules(query)
+    assert (result["function"], result["source"], result["dest_lang"]) == (function, source, dest)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "translate this to kannada",
+        "read the first line aloud",
+        "read the last sentence aloud",
+        "translate the chapter summary into hindi",
+        "What is the Hindi word for energy?",
+        "What is kinetic energy?",
+    ],
+)
+def test_rules_leave_referential_queries_to_the_llm(query):
+    assert Router().match_rules(query) is None
+
+
+@pytest.mark.parametrize(
+    "query, url",
+    [
+        ("summarize https://en.wikipedia.org/wiki/Energy.", "https://en.wikipedia.org/wiki/Energy"),
+        ("what does https://en.wikipedia.org/wiki/Energy_(physics) say?", "https://en.wikipedia.org/wiki/Energy_(physics)"),
+        ("(see www.ncert.nic.in)", "www.ncert.nic.in"),
+    ],
+)
+def test_rules_clean_urls(query, url):
+    result = Router().match_rules(query)
+    assert result["function"] == "extractor" and result["url"] == url
@@ -0,0 +1,3 @@
+def count_tokens(text):
+    """Rough LLM token count, about 4 tokens per 3 words"""
+    return len(text.split()) * 4 // 3
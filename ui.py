@@ -0,0 +1,153 @@
+"""Gradio chat UI. Mounted on the API by app.py, or run on its own with
+`python ui.py`, which loads the registry and warms up the models before serving."""
+
+import logging
+
+import gradio as gr
+
+from agent import function_caller_stream
+from audio_store import audio_store
+from logs import buffer, new_request_id, request_id, setup_logging
+from registry import registry
+from sarvam import SarvamError
+from shared import collection_name, hclient, load_registry, warmup
+
+log = logging.getLogger(__name__)
+
+
+# Gradio interface
+async def gradio_interface(input_text, grade, subject, chapter, history, request: gr.Request):
+    # Gradio runs events outside the HTTP request, so each message gets its own id
+    request_id.set(new_request_id())
+    # Picks up chapters re-indexed by other processes (and drops their cached answers)
+    registry.refresh()
+    collection = collection_name(grade, subject, chapter)
+    message = {"type": "text", "content": ""}
+    history.append((input_text, message))
+
+    # Render tokens as they arrive
+    try:
+        # Each browser session has its own conversation memory
+        async for response in function_caller_stream(input_text, collection, hclient, request.session_hash):
+            if isinstance(response, str):
+                message["content"] += response
+            elif "text" in response:
+                message["content"] = response["text"]
+            elif "audio" in response:
+                message.update(type="audio", content=audio_store.path(response["audio"]))
+            elif "sources" in response:
+                message["content"] += format_sources(response["sources"])
+            else:
+                message["content"] = "Unexpected response format"
+            yield "", history, format_history(history)
+    except SarvamError as e:
+        log.warning("speech request failed: %s", e)
+        message.update(type="text", content="Translation / speech service is unavailable, please try again.")
+        yield "", history, format_history(history)
+
+
+def format_sources(sources):
+    pages = sorted({source["page"] for source in sources if source["page"] is not None})
+    return f"\n\n*Sources: {', '.join(f'p. {page}' for page in pages)}*" if pages else ""
+
+
+def format_history(history):
+    formatted_history = []
+    for human, assistant in history:
+        formatted_history.append((human, None))
+        if assistant["type"] == "text":
+            formatted_history.append((None, assistant["content"]))
+        elif assistant["type"] == "audio":
+            formatted_history.append((None, gr.Audio(value=assistant["content"], visible=True)))
+
+    if len(formatted_history) > 10:  # Limit history memory consumption
+        formatted_history.pop(0)
+    return formatted_history
+
+
+# Dropdown choices from the registry
+def subject_choices(grade):
+    subjects = registry.subjects(grade)
+    return gr.update(choices=[(subject.title(), subject) for subject in subjects], value=subjects[0] if subjects else None)
+
+
+def chapter_choices(grade, subject):
+    chapters = registry.chapter_choices(grade, subject)
+    return gr.update(choices=chapters, value=chapters[0][1] if chapters else None)
+
+
+def refresh_choices():
+    registry.refresh()
+    grades = registry.grades()
+    grade = grades[0] if grades else None
+    subject = subject_choices(grade)
+    return gr.update(choices=grades, value=grade), subject, chapter_choices(grade, subject["value"])
+
+
+# Debug functions
+def update_debug_output():
+    return buffer.render()
+
+
+def clear_debug_history():
+    buffer.clear()
+    return "Debug history cleared."
+
+
+def toggle_debug_modal(visible):
+    return gr.update(visible=visible)
+
+
+# Gradio UI setup
+with gr.Blocks() as iface:
+    gr.Markdown("# Agentic RAG Chatbot")
+
+    # Main header row
+    with gr.Row():
+        with gr.Column(scale=19):
+            gr.Markdown("Ask a question and get an answer from the chatbot. The response may be text or audio.")
+        with gr.Column(scale=1, min_width=50):
+            debug_button = gr.Button("🖥️", size="sm")
+
+    # Chat input and interaction
+    with gr.Row():
+        with gr.Column(scale=20):
+            with gr.Row():
+                grade = gr.Dropdown(label="Grade", interactive=True)
+                subject = gr.Dropdown(label="Subject", interactive=True)
+                chapter = gr.Dropdown(label="Chapter", interactive=True)
+
+            chatbot = gr.Chatbot(label="Chat History")
+            msg = gr.Textbox(label="Your message", placeholder="Type your message here...")
+            state = gr.State([])
+
+    # Debugging modal
+    with gr.Group(visible=False) as debug_modal:
+        debug_output = gr.TextArea(label="Debug Terminal", interactive=False)
+        with gr.Row():
+            refresh_button = gr.Button("Refresh Debug History")
+            clear_button = gr.Button("Clear Debug History")
+            close_button = gr.Button("Close")
+
+    # Choices are read from the registry on page load, so newly ingested chapters show up
+    iface.load(refresh_choices, outputs=[grade, subject, chapter])
+    grade.change(subject_choices, inputs=[grade], outputs=[subject])
+    subject.change(chapter_choices, inputs=[grade, subject], outputs=[chapter])
+
+    # Submit action
+    msg.submit(gradio_interface, inputs=[msg, grade, subject, chapter, state], outputs=[msg, state, chatbot])
+
+    # Debug button click
+    debug_button.click(lambda: toggle_debug_modal(True), outputs=debug_modal).then(update_debug_output, inputs=[], outputs=[debug_output])
+
+    # Debug modal buttons
+    refresh_button.click(update_debug_output, inputs=[], outputs=[debug_output])
+    clear_button.click(clear_debug_history, inputs=[], outputs=[debug_output])
+    close_button.click(lambda: toggle_debug_modal(False), outputs=debug_modal)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    load_registry()
+    warmup()
+    iface.launch()